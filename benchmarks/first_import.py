@@ -0,0 +1,53 @@
+"""Benchmark first-import latency of `@pip` installed packages.
+
+Installs a package into a temporary directory without bytecode and times its
+first import in a fresh interpreter before and after `compile_bytecode`.
+Imports "before" are run with `PYTHONDONTWRITEBYTECODE=1` to mimic tasks on
+read-only/ephemeral filesystems that pay the compilation cost every time.
+
+Usage: `python benchmarks/first_import.py <requirement> <module> [repeats]`
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from metaflow_extensions.nesta.utils import compile_bytecode, pip_install
+
+
+def time_first_import(module: str, path: str, **env: str) -> float:
+    """Seconds taken to import `module` from `path` in a fresh interpreter."""
+    code = (
+        "import time; start = time.perf_counter(); import {};"
+        " print(time.perf_counter() - start)".format(module)
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code],
+        env={**os.environ, "PYTHONPATH": path, **env},
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return float(process.stdout)
+
+
+def main(requirement: str, module: str, repeats: int = 5) -> None:
+    """Print median first-import latency before and after compilation."""
+    with tempfile.TemporaryDirectory() as target:
+        pip_install(sys.executable, requirement, "--no-compile", "--target", target)
+
+        before = [
+            time_first_import(module, target, PYTHONDONTWRITEBYTECODE="1")
+            for _ in range(repeats)
+        ]
+        compile_bytecode(sys.executable, target)
+        after = [time_first_import(module, target) for _ in range(repeats)]
+
+    print(f"{module} first import (median of {repeats}):")
+    print(f"  without bytecode: {statistics.median(before):.3f}s")
+    print(f"  with bytecode:    {statistics.median(after):.3f}s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2], *map(int, sys.argv[3:]))
@@ -0,0 +1,86 @@
+"""Benchmark `@pip` installer backends.
+
+Builds wheels for requirements once, then times installing them from those
+wheels into empty temporary directories with
+- `pip install --no-index --find-links` (the "pip" installer)
+- `WheelInstaller`, in-process (the "wheel" installer), including its
+  consistency check
+
+Usage: `python benchmarks/installers.py <requirement>... [--repeats N]`
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from metaflow_extensions.nesta.installers import WheelInstaller
+from metaflow_extensions.nesta.utils import pip, pip_install
+
+
+def time_pip(wheelhouse: str, requirements: List[str]) -> float:
+    """Seconds taken to install `requirements` from `wheelhouse` with pip."""
+    with tempfile.TemporaryDirectory() as target:
+        start = time.perf_counter()
+        pip_install(
+            sys.executable,
+            tuple(requirements),
+            "--no-compile",
+            "--no-index",
+            "--find-links",
+            wheelhouse,
+            "--target",
+            target,
+        )
+        return time.perf_counter() - start
+
+
+def time_wheel(wheelhouse: str, requirements: List[str]) -> float:
+    """Seconds taken to install `requirements` from `wheelhouse` in-process."""
+    with tempfile.TemporaryDirectory() as target:
+        paths = {
+            "purelib": target,
+            "platlib": target,
+            "scripts": str(Path(target) / "bin"),
+            "include": str(Path(target) / "include"),
+            "data": target,
+        }
+        start = time.perf_counter()
+        installer = WheelInstaller([wheelhouse], paths=paths)
+        installer.install(requirements)
+        installer.check()
+        return time.perf_counter() - start
+
+
+def main(requirements: List[str], repeats: int = 5) -> None:
+    """Print median install time of `requirements` for each installer."""
+    with tempfile.TemporaryDirectory() as wheelhouse:
+        pip(
+            sys.executable,
+            "wheel",
+            "--quiet",
+            "--wheel-dir",
+            wheelhouse,
+            *requirements,
+            stdout=subprocess.DEVNULL,
+        )
+        n_wheels = len(list(Path(wheelhouse).glob("*.whl")))
+        timings = {
+            "pip": [time_pip(wheelhouse, requirements) for _ in range(repeats)],
+            "wheel": [time_wheel(wheelhouse, requirements) for _ in range(repeats)],
+        }
+
+    print(f"Install {n_wheels} wheels (median of {repeats}):")
+    for installer, seconds in timings.items():
+        print(f"  {installer}: {statistics.median(seconds):.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("requirements", nargs="+")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    main(args.requirements, args.repeats)
@@ -12,3 +12,42 @@ CLIENT_CACHE_PATH = from_conf("METAFLOW_CLIENT_CACHE_PATH", "/tmp/metaflow_clien
 
 # Maximum size (in bytes) of the cache
 CLIENT_CACHE_MAX_SIZE = from_conf("METAFLOW_CLIENT_CACHE_MAX_SIZE", "10000")
+
+# Set to "true" to build the `@pip` environments of locally run steps in the
+# background while earlier steps run
+PIP_PREFETCH = from_conf("METAFLOW_PIP_PREFETCH", "false")
+
+# Path to the wheels built by `@pip` prefetching
+PIP_PREFETCH_PATH = from_conf(
+    "METAFLOW_PIP_PREFETCH_PATH", "/tmp/metaflow_pip_prefetch"
+)
+
+# Maximum number of `@pip` environments to prefetch concurrently
+PIP_PREFETCH_MAX_WORKERS = from_conf("METAFLOW_PIP_PREFETCH_MAX_WORKERS", "2")
+
+# Days after which prefetched `@pip` environments that haven't been used are
+# deleted
+PIP_PREFETCH_MAX_AGE = from_conf("METAFLOW_PIP_PREFETCH_MAX_AGE", "7")
+
+# Seconds between samples of task resource usage (`@resource_monitor`)
+RESOURCE_MONITOR_INTERVAL = from_conf("METAFLOW_RESOURCE_MONITOR_INTERVAL", "1")
+
+# Maximum number of resource usage samples stored per task, longer tasks are
+# downsampled
+RESOURCE_MONITOR_MAX_SAMPLES = from_conf(
+    "METAFLOW_RESOURCE_MONITOR_MAX_SAMPLES", "1000"
+)
+
+# Path resource usage samples are spooled to while a task runs
+RESOURCE_MONITOR_PATH = from_conf(
+    "METAFLOW_RESOURCE_MONITOR_PATH", "/tmp/metaflow_resource_monitor"
+)
+
+# Path to the host-level cache of shared task inputs (`host_cache`)
+HOST_CACHE_PATH = from_conf("METAFLOW_HOST_CACHE_PATH", "/tmp/metaflow_host_cache")
+
+# Maximum size (in bytes) of the host-level cache of shared task inputs
+HOST_CACHE_MAX_SIZE = from_conf("METAFLOW_HOST_CACHE_MAX_SIZE", str(10 * 1024**3))
+
+# Maximum number of concurrent downloads (and builds) of `@pip` requirements
+PIP_DOWNLOAD_MAX_WORKERS = from_conf("METAFLOW_PIP_DOWNLOAD_MAX_WORKERS", "8")
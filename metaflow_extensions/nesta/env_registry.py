@@ -0,0 +1,366 @@
+"""Datastore-backed registry of `@pip` environments shared across flows.
+
+Flows that share requirements (e.g. several flows next to one
+`requirements.txt`) would each download and build the same environment.
+Instead, with `@pip(shared=True)`, the first step to need an environment
+builds it into a wheelhouse (every wheel needed to install the
+requirements) and publishes it to the registry. Any step of any flow with
+the same environment spec then installs from the published wheels.
+
+Environments are keyed by a hash of their normalized spec (see
+`environment_spec`): the requirements (names canonicalized, specifiers and
+requirements sorted), the contents of the preinstall scripts run before the
+step, the Python version and the platform.
+
+Layout, relative to the datastore root:
+```
+_environments/
+├── <key>/
+│   ├── <build>/*.whl  # Wheelhouse, `<build>` is unique to each publish
+│   └── spec.json      # Spec, build, creation time and size, written last
+└── _users/<flow>/<step>.json  # Key of the environment used and when
+```
+
+Implementation notes:
+- An environment is complete once its `spec.json` exists, so a partially
+  published (or deleted) environment is never used.
+- Steps building the same environment concurrently each publish their
+  wheels under their own build and the last `spec.json` written wins, so
+  wheels of different builds are never mixed. Steps skip publishing if the
+  environment was published while they were building.
+- The datastore has no atomic counters, so each step using an environment
+  records it in its own file under `_users/` (overwriting the environment it
+  used before). The reference count of an environment is the number of steps
+  whose latest use is that environment.
+- `python flow.py environments gc` removes users that haven't used their
+  environment within `--max-age` days (e.g. deleted flows), then deletes
+  environments that have no users and haven't been used within `--max-age`
+  days. Builds not referenced by a `spec.json` (e.g. from steps that died
+  mid-publish or lost a concurrent publish) are deleted once their wheels
+  are older than `--max-age` days.
+"""
+import hashlib
+import json
+import shutil
+import sys
+import sysconfig
+import time
+import uuid
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# Directory of the registry, relative to the datastore root
+REGISTRY_DIR = "_environments"
+
+USERS_DIR = "_users"
+
+
+class Environment(NamedTuple):
+    """Environment published to the registry."""
+
+    key: str
+    spec: Dict[str, Any]
+    build: str
+    created: float
+    size: int
+    users: Dict[str, float]  # "<flow>/<step>" to time last used
+
+    @property
+    def last_used(self) -> float:
+        """Time the environment was last used (or created)."""
+        return max([self.created, *self.users.values()])
+
+
+def environment_spec(
+    requirement_args: Sequence[str], preinstall_scripts: Sequence[Path] = ()
+) -> Dict[str, Any]:
+    """Normalized spec of the environment `requirement_args` install.
+
+    Requirement arguments other than requirements and `-r` (e.g. `-e`) raise
+    `UnsupportedRequirementsError`.
+
+    Args:
+        requirement_args: `pip install` requirement arguments.
+        preinstall_scripts: Preinstall scripts run before installing.
+
+    Returns:
+        Spec of the environment.
+    """
+    from metaflow_extensions.nesta.installers import parse_requirement_args
+    from pip._vendor.packaging.utils import canonicalize_name
+
+    requirements = set()
+    for req in parse_requirement_args(requirement_args):
+        extras = f"[{','.join(sorted(req.extras))}]" if req.extras else ""
+        url = f" @ {req.url}" if req.url else ""
+        marker = f"; {req.marker}" if req.marker else ""
+        # `SpecifierSet` sorts its specifiers
+        requirements.add(
+            f"{canonicalize_name(req.name)}{extras}{req.specifier}{url}{marker}"
+        )
+    return {
+        "requirements": sorted(requirements),
+        # Scripts run in order, their names don't matter
+        "preinstall": [
+            hashlib.sha256(Path(path).read_bytes()).hexdigest()
+            for path in preinstall_scripts
+        ],
+        "python": "{}{}.{}".format(sys.implementation.name, *sys.version_info[:2]),
+        "platform": sysconfig.get_platform(),
+    }
+
+
+def spec_key(spec: Dict[str, Any]) -> str:
+    """Registry key of the environment with `spec`."""
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def build_wheelhouse(
+    executable: str, requirement_args: Sequence[str], path: Path
+) -> None:
+    """Build wheels of `requirement_args` and all their dependencies into `path`."""
+    import subprocess
+
+    from metaflow_extensions.nesta.utils import pip
+
+    pip(
+        executable,
+        "wheel",
+        "--quiet",
+        "--wheel-dir",
+        str(path),
+        *requirement_args,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+class EnvironmentRegistry(object):
+    """Registry of environments in the datastore of `storage`.
+
+    Parameters:
+        storage (DataStoreStorage): Storage of a (flow) datastore, the
+          registry is shared by all the flows in the datastore.
+    """
+
+    def __init__(self, storage):  # noqa: D107
+        self._storage = storage
+
+    def has(self, key: str) -> bool:
+        """Has the environment `key` been published?"""
+        return self._storage.is_file([self._spec_path(key)])[0]
+
+    def publish(self, key: str, spec: Dict[str, Any], wheelhouse: Path) -> bool:
+        """Publish the wheels in `wheelhouse` as environment `key`.
+
+        Args:
+            key: Key of the environment.
+            spec: Spec of the environment.
+            wheelhouse: Directory of the wheels of the environment.
+
+        Returns:
+            False if not published as `key` already was (e.g. concurrently).
+        """
+        if self.has(key):
+            return False
+        build = uuid.uuid4().hex
+        created = time.time()
+        wheels = sorted(wheelhouse.glob("*.whl"))
+        self._storage.save_bytes(
+            (
+                (
+                    self._path(key, build, wheel.name),
+                    (BytesIO(wheel.read_bytes()), {"created": created}),
+                )
+                for wheel in wheels
+            ),
+            overwrite=True,
+        )
+        info = {
+            "spec": spec,
+            "build": build,
+            "created": created,
+            "size": sum(wheel.stat().st_size for wheel in wheels),
+        }
+        self._storage.save_bytes(
+            [(self._spec_path(key), BytesIO(json.dumps(info).encode()))],
+            overwrite=True,
+        )
+        return True
+
+    def fetch(self, key: str, path: Path) -> List[Path]:
+        """Download the wheels of environment `key` to `path`."""
+        infos = self._load_json([self._spec_path(key)])
+        if not infos:  # Deleted concurrently
+            raise FileNotFoundError(self._storage.full_uri(self._spec_path(key)))
+        (info,) = infos.values()
+        # Other files are e.g. metadata of the local datastore
+        paths = [
+            path
+            for path in self._files(self._path(key, info["build"]))
+            if path.endswith(".whl")
+        ]
+        wheels = []
+        with self._storage.load_bytes(paths) as loaded:
+            for remote_path, local_path, _ in loaded:
+                if local_path is None:  # Deleted concurrently
+                    raise FileNotFoundError(self._storage.full_uri(remote_path))
+                wheel = path / self._storage.basename(remote_path)
+                shutil.copyfile(local_path, wheel)
+                wheels.append(wheel)
+        return wheels
+
+    def use(self, key: str, flow_name: str, step_name: str) -> None:
+        """Record that step `step_name` of `flow_name` uses environment `key`."""
+        user = {"key": key, "ts": time.time()}
+        self._storage.save_bytes(
+            [
+                (
+                    self._path(USERS_DIR, flow_name, f"{step_name}.json"),
+                    BytesIO(json.dumps(user).encode()),
+                )
+            ],
+            overwrite=True,
+        )
+
+    def users(self) -> Dict[str, Tuple[str, float]]:
+        """Environment key used by each "<flow>/<step>" and when."""
+        users_dir = self._path(USERS_DIR)
+        flow_dirs = [
+            result.path
+            for result in self._storage.list_content([users_dir])
+            if not result.is_file
+        ]
+        users = {}
+        for path, info in self._load_json(self._files(*flow_dirs)).items():
+            flow_name = self._storage.basename(self._storage.dirname(path))
+            step_name = self._storage.basename(path)[: -len(".json")]
+            users[f"{flow_name}/{step_name}"] = (info["key"], info["ts"])
+        return users
+
+    def environments(self) -> List[Environment]:
+        """Published environments, most recently used first."""
+        users_by_key: Dict[str, Dict[str, float]] = {}
+        for user, (key, ts) in self.users().items():
+            users_by_key.setdefault(key, {})[user] = ts
+
+        infos = self._load_json([self._spec_path(key) for key in self._keys()])
+        environments = [
+            Environment(
+                key=key,
+                spec=info["spec"],
+                build=info["build"],
+                created=info["created"],
+                size=info["size"],
+                users=users_by_key.get(key, {}),
+            )
+            for key, info in (
+                (self._storage.basename(self._storage.dirname(path)), info)
+                for path, info in infos.items()
+            )
+        ]
+        return sorted(environments, key=lambda env: env.last_used, reverse=True)
+
+    def gc(
+        self, max_age: float, now: Optional[float] = None, dry_run: bool = False
+    ) -> Tuple[List[str], List[Environment], List[str]]:
+        """Remove users, environments and builds unused for `max_age` seconds.
+
+        Args:
+            max_age: Age (in seconds) after which users, unused environments
+                and builds not referenced by an environment are removed.
+            now: Current time, defaults to `time.time()`.
+            dry_run: If True, only report what would be removed.
+
+        Returns:
+            Users ("<flow>/<step>"), environments and paths of builds removed.
+        """
+        from metaflow_extensions.nesta.utils import delete_paths
+
+        cutoff = (time.time() if now is None else now) - max_age
+        stale_users = [user for user, (_, ts) in self.users().items() if ts < cutoff]
+        if not dry_run:
+            delete_paths(
+                self._storage,
+                [self._path(USERS_DIR, f"{user}.json") for user in stale_users],
+            )
+
+        orphaned_builds = self._orphaned_builds(cutoff)
+        if not dry_run:
+            delete_paths(
+                self._storage,
+                [path for build in orphaned_builds for path in self._files(build)],
+            )
+
+        stale_environments = [
+            env
+            for env in self.environments()
+            if not set(env.users) - set(stale_users) and env.last_used < cutoff
+        ]
+        if not dry_run:
+            for env in stale_environments:
+                # Delete `spec.json` first so the environment is never used
+                # partially deleted
+                delete_paths(
+                    self._storage,
+                    [
+                        self._spec_path(env.key),
+                        *self._files(self._path(env.key, env.build)),
+                    ],
+                )
+        return stale_users, stale_environments, orphaned_builds
+
+    def _orphaned_builds(self, cutoff: float) -> List[str]:
+        """Paths of builds not in a `spec.json` with no wheels newer than `cutoff`."""
+        key_dirs = [self._path(key) for key in self._keys()]
+        referenced = {
+            self._storage.path_join(self._storage.dirname(path), info["build"])
+            for path, info in self._load_json(
+                [self._storage.path_join(path, "spec.json") for path in key_dirs]
+            ).items()
+        }
+        orphaned = []
+        for result in self._storage.list_content(key_dirs):
+            if result.is_file or result.path in referenced:
+                continue
+            files = self._files(result.path)
+            wheels = [path for path in files if path.endswith(".whl")]
+            if files and all(self._created(path) < cutoff for path in wheels):
+                orphaned.append(result.path)
+        return orphaned
+
+    def _created(self, path: str) -> float:
+        """Time the wheel at `path` was published, 0 if unknown."""
+        _, meta = self._storage.info_file(path)
+        return float((meta or {}).get("created", 0))
+
+    def _keys(self) -> List[str]:
+        return [
+            self._storage.basename(result.path)
+            for result in self._storage.list_content([REGISTRY_DIR])
+            if not result.is_file and self._storage.basename(result.path) != USERS_DIR
+        ]
+
+    def _path(self, *parts: str) -> str:
+        return self._storage.path_join(REGISTRY_DIR, *parts)
+
+    def _spec_path(self, key: str) -> str:
+        return self._path(key, "spec.json")
+
+    def _files(self, *paths: str) -> List[str]:
+        if not paths:
+            return []
+        return [
+            result.path
+            for result in self._storage.list_content(paths)
+            if result.is_file
+        ]
+
+    def _load_json(self, paths: List[str]) -> Dict[str, Any]:
+        contents = {}
+        with self._storage.load_bytes(paths) as loaded:
+            for path, local_path, _ in loaded:
+                if local_path is not None:
+                    with open(local_path) as f:
+                        contents[path] = json.load(f)
+        return contents
@@ -0,0 +1,166 @@
+"""Host-level cache of shared task inputs.
+
+Tasks of a step often start by loading the same reference data (lookup
+tables, model weights, ...). When several tasks run on the same host (e.g.
+foreach tasks packed onto one Batch instance) each would download its own
+copy. `host_cache` downloads each URI once per host into a shared local cache
+that all tasks on the host read from:
+```python
+from metaflow import host_cache
+
+with host_cache("s3://bucket/weights.bin") as path:
+    model = load_model(path)
+```
+
+Implementation notes:
+- An entry of the cache is a directory, `METAFLOW_HOST_CACHE_PATH/<key>/`,
+  holding the downloaded file (with its original name). `<key>` hashes the
+  URI. Downloads are written to a temporary directory then atomically moved
+  in place so a partially downloaded file is never visible.
+- Each entry has a lock file, `<key>.lock`, locked with `flock`:
+  - exclusively to download, so concurrent tasks wait for the one download
+  - shared while the path is in use (inside the `with` block)
+- After a download, least recently used entries are evicted until the cache
+  fits in `METAFLOW_HOST_CACHE_MAX_SIZE` bytes. Entries in use can't be
+  locked exclusively so are never evicted, the cache may exceed its maximum
+  size while they're in use. Lock files are never deleted: a task could
+  otherwise lock a lock file that was just replaced.
+- Supported URIs: `s3://` (with Metaflow's S3 client), `http(s)://`, and
+  `file://` or local paths.
+
+This module is imported at Metaflow's top-level so must not import Metaflow
+at module level.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+
+@contextmanager
+def host_cache(
+    uri: str, cache_path: Optional[str] = None, max_size: Optional[int] = None
+) -> Iterator[Path]:
+    """Local path of `uri` in the host's cache, downloading it if needed.
+
+    Args:
+        uri: `s3://`, `http(s)://`, `file://` URI or local path to fetch.
+        cache_path: Directory of the cache, defaults to
+            `METAFLOW_HOST_CACHE_PATH`.
+        max_size: Maximum size (in bytes) of the cache, defaults to
+            `METAFLOW_HOST_CACHE_MAX_SIZE`.
+
+    Yields:
+        Path of the cached file, valid until the end of the `with` block.
+    """
+    from metaflow_extensions.nesta.config.metaflow_config import (
+        HOST_CACHE_MAX_SIZE,
+        HOST_CACHE_PATH,
+    )
+
+    root = Path(cache_path or HOST_CACHE_PATH)
+    max_size = int(HOST_CACHE_MAX_SIZE) if max_size is None else max_size
+    key = hashlib.sha1(uri.encode()).hexdigest()  # noqa: S303 - not for security
+    entry = root / key
+    url = urlparse(uri)
+    # Plain paths aren't percent-encoded
+    name = os.path.basename(unquote(url.path) if url.scheme else url.path) or key
+    root.mkdir(parents=True, exist_ok=True)
+
+    with open(root / f"{key}.lock", "a") as lock:
+        while True:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            if (entry / name).exists():
+                break
+            # Lock exclusively to download. Another task may download (or
+            # evict) the entry in the meantime so check again.
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not (entry / name).exists():
+                _fetch(uri, entry, name)
+                _evict(root, max_size)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        try:
+            os.utime(entry)  # Mark as recently used
+            yield entry / name
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _fetch(uri: str, entry: Path, name: str) -> None:
+    """Download `uri` to `entry / name`, atomically."""
+    start = time.time()
+    tmp = Path(tempfile.mkdtemp(prefix=f".{entry.name}-", dir=entry.parent))
+    try:
+        _download(uri, tmp / name)
+        os.replace(tmp, entry)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    logging.info(
+        f"Cached {uri} ({(entry / name).stat().st_size} bytes)"
+        f" in {time.time() - start:.1f}s"
+    )
+
+
+def _download(uri: str, path: Path) -> None:
+    """Download `uri` to `path`."""
+    url = urlparse(uri)
+    if url.scheme == "s3":
+        from metaflow import S3
+
+        with S3() as s3:
+            shutil.move(s3.get(uri).path, path)
+    elif url.scheme in ("http", "https"):
+        from urllib.request import urlopen
+
+        with urlopen(uri) as response, open(path, "wb") as f:  # noqa: S310
+            shutil.copyfileobj(response, f)
+    elif url.scheme == "file":
+        from urllib.request import url2pathname
+
+        shutil.copyfile(url2pathname(url.path), path)
+    elif url.scheme == "":
+        shutil.copyfile(uri, path)
+    else:
+        raise ValueError(f"Unsupported URI: {uri}")
+
+
+def _evict(root: Path, max_size: int) -> None:
+    """Evict least recently used entries not in use until `root` fits `max_size`."""
+    entries = _entries(root)
+    size = sum(entry_size for _, _, entry_size in entries)
+    for _, entry, entry_size in sorted(entries):
+        if size <= max_size:
+            return
+        with open(f"{entry}.lock", "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:  # In use
+                continue
+            try:
+                shutil.rmtree(entry, ignore_errors=True)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        size -= entry_size
+        logging.info(f"Evicted {entry} ({entry_size} bytes) from the host cache")
+
+
+def _entries(root: Path) -> List[Tuple[float, Path, int]]:
+    """Last use, path and size of the entries of the cache at `root`."""
+    entries = []
+    for entry in root.iterdir():
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        try:
+            size = sum(f.stat().st_size for f in entry.iterdir())
+            entries.append((entry.stat().st_mtime, entry, size))
+        except FileNotFoundError:  # Evicted concurrently
+            continue
+    return entries
@@ -0,0 +1,467 @@
+"""Installer backends for `@pip`.
+
+- `PipInstaller` runs `python -m pip install` and `python -m pip check` in
+  subprocesses. It supports everything pip does and is always the fallback.
+- `WheelInstaller` installs into the current interpreter in-process, from a
+  local set of wheels (e.g. prefetched wheels, or a directory of wheels
+  produced with `pip wheel`/`pip download` acting as a lock). It resolves
+  requirements against those wheels only, unpacks wheels directly into
+  site-packages in parallel, and checks consistency from installed
+  distributions' metadata rather than with `pip check`. This avoids pip's
+  startup and resolver overhead which dominates small installs.
+
+`WheelInstaller` raises `UnsupportedRequirementsError` for anything it can't
+handle (e.g. editable installs, index options, missing or conflicting
+wheels) *before* modifying the environment, so callers can fall back to
+`PipInstaller`.
+"""
+import email.parser
+import logging
+import os
+import shutil
+import sys
+import sysconfig
+import zipfile
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+try:
+    from importlib import metadata
+except ImportError:  # Python 3.7
+    from metaflow._vendor.v3_6 import importlib_metadata as metadata
+
+# pip's vendored copy of `packaging` is always present where `@pip` works
+from pip._vendor.packaging.requirements import InvalidRequirement, Requirement
+from pip._vendor.packaging.tags import sys_tags
+from pip._vendor.packaging.utils import (
+    canonicalize_name,
+    InvalidWheelFilename,
+    parse_wheel_filename,
+)
+from pip._vendor.packaging.version import Version
+
+
+# Files extracted from a wheel per unpacking task
+UNPACK_CHUNK_FILES = 32
+
+
+class UnsupportedRequirementsError(Exception):
+    """Requirements that `WheelInstaller` can't install."""
+
+
+class InconsistentRequirementsError(Exception):
+    """Installed distributions have unmet requirements."""
+
+
+class PipInstaller(object):
+    """Install with `pip` in a subprocess.
+
+    Parameters:
+        executable (str): Python executable to install for.
+        find_links (Sequence[str]): Directories of wheels to install from
+          instead of the package index.
+    """
+
+    def __init__(self, executable: str, find_links: Sequence[str] = ()):  # noqa: D107
+        self.executable = executable
+        self.find_links = find_links
+
+    def install(self, requirement_args: Sequence[str]) -> None:
+        """`pip install <requirement_args>`."""
+        from metaflow_extensions.nesta.utils import pip_install
+
+        args = []
+        if self.find_links:
+            args.append("--no-index")
+        for path in self.find_links:
+            args.extend(["--find-links", str(path)])
+        # pip compiles serially, `compile_bytecode` compiles in parallel
+        pip_install(self.executable, tuple(requirement_args), "--no-compile", *args)
+
+    def check(self) -> None:
+        """`pip check`."""
+        from metaflow_extensions.nesta.utils import pip
+
+        pip(self.executable, "check", capture_output=True)
+
+
+class Wheel(object):
+    """A wheel file in a local wheel set."""
+
+    def __init__(self, path: Path):  # noqa: D107
+        self.path = path
+        self.name, self.version, _, self.tags = parse_wheel_filename(path.name)
+        self._dist_info_name: Optional[str] = None
+
+    def metadata(self) -> email.message.Message:
+        """Parsed `METADATA` of the wheel."""
+        with zipfile.ZipFile(self.path) as zf:
+            return email.parser.Parser().parsestr(
+                zf.read(f"{self._dist_info}/METADATA").decode()
+            )
+
+    def requires(self, extras: Set[str]) -> List[Requirement]:
+        """Requirements of the wheel that apply for `extras`."""
+        return _applicable(self.metadata().get_all("Requires-Dist") or [], extras)
+
+    @property
+    def _dist_info(self) -> str:
+        if self._dist_info_name is None:
+            with zipfile.ZipFile(self.path) as zf:
+                self._dist_info_name = next(
+                    name.split("/")[0]
+                    for name in zf.namelist()
+                    if name.count("/") == 1 and name.endswith(".dist-info/METADATA")
+                )
+        return self._dist_info_name
+
+
+def _applies(req: Requirement, extras: Set[str]) -> bool:
+    """Whether the marker of `req` applies for `extras` in this environment."""
+    return req.marker is None or any(
+        req.marker.evaluate({"extra": extra}) for extra in (extras or {""})
+    )
+
+
+def _applicable(requires: Sequence[str], extras: Set[str]) -> List[Requirement]:
+    """Parse `requires` keeping those whose markers apply for `extras`."""
+    return [req for req in map(Requirement, requires) if _applies(req, extras)]
+
+
+class WheelInstaller(object):
+    """Install from local wheels, in-process.
+
+    Parameters:
+        find_links (Sequence[str]): Directories of wheels to resolve against.
+        paths (Dict[str, str]): Install scheme (as `sysconfig.get_paths()`),
+          defaults to the scheme of the current interpreter.
+        max_workers (int): Number of chunks of files (of any of the wheels)
+          to unpack concurrently.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        find_links: Sequence[str],
+        paths: Optional[Dict[str, str]] = None,
+        max_workers: Optional[int] = None,
+    ):
+        supported = {tag: i for i, tag in enumerate(sys_tags())}
+        candidates: Dict[str, List[Tuple[Version, int, Wheel]]] = {}
+        for directory in find_links:
+            for path in Path(directory).glob("*.whl"):
+                try:
+                    wheel = Wheel(path)
+                except InvalidWheelFilename as e:
+                    raise UnsupportedRequirementsError(str(e)) from e
+                priority = min(
+                    (supported[tag] for tag in wheel.tags if tag in supported),
+                    default=None,
+                )
+                if priority is not None:
+                    candidates.setdefault(wheel.name, []).append(
+                        (wheel.version, -priority, wheel)
+                    )
+        # Best candidate first: highest version, then most specific tag
+        self.wheels = {
+            name: [c[2] for c in sorted(cs, key=lambda c: c[:2], reverse=True)]
+            for name, cs in candidates.items()
+        }
+        self.scheme = {
+            key: Path(path) for key, path in (paths or sysconfig.get_paths()).items()
+        }
+        # Where installed distributions are looked up
+        self.path = (
+            sys.path
+            if paths is None
+            else list({str(self.scheme["purelib"]), str(self.scheme["platlib"])})
+        )
+        self.max_workers = max_workers or os.cpu_count()
+
+    def install(self, requirement_args: Sequence[str]) -> None:
+        """Install `requirement_args` (requirements and `-r <path>` only)."""
+        import importlib
+
+        to_install = self.resolve(list(parse_requirement_args(requirement_args)))
+        installed = self.installed()
+        outdated = [installed[w.name] for w in to_install if w.name in installed]
+        # Validate every destination before modifying anything
+        layouts = [wheel_layout(wheel, self.scheme) for wheel in to_install]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(_uninstall, outdated))
+            install_wheels(layouts, executor)
+        importlib.invalidate_caches()
+
+    def resolve(self, requirements: List[Requirement]) -> List[Wheel]:
+        """Wheels to install to satisfy `requirements`."""
+        # Greedy: the best wheel satisfying the requirements seen so far is
+        # chosen for each project, there is no backtracking on conflicts.
+        installed = self.installed()
+        chosen: Dict[str, Wheel] = {}
+        seen: Dict[str, List[Requirement]] = {}
+        expanded: Set[Tuple[str, FrozenSet[str]]] = set()
+        queue = [req for req in requirements if _applies(req, set())]
+        while queue:
+            req = queue.pop(0)
+            name = canonicalize_name(req.name)
+            seen.setdefault(name, []).append(req)
+
+            if name in chosen:
+                if not req.specifier.contains(chosen[name].version, prereleases=True):
+                    raise UnsupportedRequirementsError(
+                        f"Conflicting requirements: {req}"
+                    )
+                dist = None
+            else:
+                dist = installed.get(name)
+                if dist is None or not all(
+                    r.specifier.contains(dist.version, prereleases=True)
+                    for r in seen[name]
+                ):
+                    chosen[name] = self._best_wheel(name, seen[name])
+                    dist = None
+                    if any(expanded_name == name for expanded_name, _ in expanded):
+                        # Expanded as installed, re-expand the chosen wheel's
+                        # dependencies for the extras requested so far
+                        expanded = {e for e in expanded if e[0] != name}
+                        queue.extend(seen[name][:-1])
+
+            extras = frozenset(req.extras)
+            if (name, extras) in expanded:
+                continue
+            expanded.add((name, extras))
+            if dist is not None:  # Already satisfied by the environment
+                queue.extend(_applicable(dist.requires or [], set(extras)))
+            else:
+                queue.extend(chosen[name].requires(set(extras)))
+        return list(chosen.values())
+
+    def _best_wheel(self, name: str, requirements: List[Requirement]) -> Wheel:
+        for wheel in self.wheels.get(name, []):
+            if all(
+                r.specifier.contains(wheel.version, prereleases=True)
+                for r in requirements
+            ):
+                return wheel
+        raise UnsupportedRequirementsError(f"No local wheel for {requirements[0]}")
+
+    def installed(self) -> Dict[str, metadata.Distribution]:
+        """Installed distributions by canonical project name."""
+        dists: Dict[str, metadata.Distribution] = {}
+        for dist in metadata.distributions(path=self.path):
+            # Earlier entries of the path shadow later ones
+            dists.setdefault(canonicalize_name(dist.metadata["Name"] or ""), dist)
+        return dists
+
+    def check(self) -> None:
+        """Raise `InconsistentRequirementsError` if installed distributions conflict."""
+        installed = self.installed()
+        problems = []
+        for dist in installed.values():
+            try:
+                requires = _applicable(dist.requires or [], set())
+            except InvalidRequirement:
+                continue
+            for req in requires:
+                dep = installed.get(canonicalize_name(req.name))
+                if dep is None:
+                    problems.append(f"{dist.metadata['Name']} requires {req}")
+                elif not req.specifier.contains(dep.version, prereleases=True):
+                    problems.append(
+                        f"{dist.metadata['Name']} requires {req} but has {dep.version}"
+                    )
+        if problems:
+            raise InconsistentRequirementsError("\n".join(problems))
+
+
+def parse_requirement_args(requirement_args: Sequence[str]) -> Iterator[Requirement]:
+    """Parse `pip install` requirement arguments (requirements, `-r <path>`)."""
+    args = iter(requirement_args)
+    for arg in args:
+        if arg in ("-r", "--requirement"):
+            path = Path(next(args))
+            lines = path.read_text().splitlines()
+            yield from parse_requirement_args(_requirement_file_args(lines, path))
+        elif arg.startswith("-"):
+            raise UnsupportedRequirementsError(f"Unsupported pip argument: {arg}")
+        else:
+            try:
+                yield Requirement(arg)
+            except InvalidRequirement as e:  # e.g. a path or URL
+                raise UnsupportedRequirementsError(
+                    f"Unsupported requirement: {arg}"
+                ) from e
+
+
+def _requirement_file_args(lines: List[str], path: Path) -> Iterator[str]:
+    for line in lines:
+        line = line.split(" #")[0].strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith(("-r ", "--requirement ")):
+            yield "-r"
+            yield str(path.parent / line.split(maxsplit=1)[1])
+        else:
+            yield line
+
+
+def _uninstall(dist: metadata.Distribution) -> None:
+    """Remove the files of installed distribution `dist`."""
+    logging.info(f"Uninstalling {dist.metadata['Name']} {dist.version}.")
+    for file in dist.files or []:
+        path = Path(dist.locate_file(file))
+        if path.is_file() or path.is_symlink():
+            path.unlink()
+    shutil.rmtree(dist._path, ignore_errors=True)  # The `.dist-info` directory
+
+
+class WheelLayout(NamedTuple):
+    """Where the files of a wheel are installed."""
+
+    wheel: Wheel
+    scheme: Dict[str, Path]
+    root: Path  # purelib or platlib, where the `.dist-info` directory goes
+    entry_points: str
+    targets: List[Tuple[str, Path, bool]]  # Member, destination, is a script
+
+
+def wheel_layout(wheel: Wheel, scheme: Dict[str, Path]) -> WheelLayout:
+    """Validated destinations of the files of `wheel` in install `scheme`."""
+    scheme = {**scheme, "headers": scheme["include"] / wheel.name}
+    dist_info = wheel._dist_info
+    with zipfile.ZipFile(wheel.path) as zf:
+        wheel_info = email.parser.Parser().parsestr(
+            zf.read(f"{dist_info}/WHEEL").decode()
+        )
+        entry_points = (
+            zf.read(f"{dist_info}/entry_points.txt").decode()
+            if f"{dist_info}/entry_points.txt" in zf.namelist()
+            else ""
+        )
+        infos = zf.infolist()
+    purelib = wheel_info.get("Root-Is-Purelib", "true").lower() == "true"
+    root = scheme["purelib" if purelib else "platlib"]
+
+    targets: List[Tuple[str, Path, bool]] = []
+    for info in infos:
+        if info.is_dir() or info.filename == f"{dist_info}/RECORD":
+            continue
+        parts = info.filename.split("/")
+        if parts[0].endswith(".data") and len(parts) > 2:
+            base, relpath = scheme[parts[1]], "/".join(parts[2:])
+        else:
+            base, relpath = root, info.filename
+        dest = (base / relpath).resolve()
+        if base.resolve() not in dest.parents:
+            raise UnsupportedRequirementsError(f"Unsafe path in {wheel.path.name}")
+        targets.append((info.filename, dest, base == scheme["scripts"]))
+    return WheelLayout(wheel, scheme, root, entry_points, targets)
+
+
+def install_wheels(
+    layouts: Sequence[WheelLayout], executor: Optional[Executor] = None
+) -> None:
+    """Unpack the wheels of `layouts`, files of all wheels concurrently."""
+    for directory in {
+        dest.parent for layout in layouts for _, dest, _ in layout.targets
+    }:
+        directory.mkdir(parents=True, exist_ok=True)
+
+    # Split the files of every wheel into chunks so that many small wheels
+    # and a few large wheels (e.g. numpy) alike keep all workers busy, each
+    # chunk reads from its own handle.
+    paths, chunks = [], []
+    for layout in layouts:
+        n_chunks = max(1, -(-len(layout.targets) // UNPACK_CHUNK_FILES))
+        for i in range(n_chunks):
+            paths.append(layout.wheel.path)
+            chunks.append(layout.targets[i::n_chunks])
+    list(
+        executor.map(_unpack, paths, chunks)
+        if executor
+        else map(_unpack, paths, chunks)
+    )
+
+    for layout in layouts:
+        _write_record(layout)
+
+
+def _write_record(layout: WheelLayout) -> None:
+    """Write console scripts, `INSTALLER` and `RECORD` of an unpacked wheel."""
+    logging.info(f"Installed {layout.wheel.path.name}.")
+    root, dist_info = layout.root, layout.wheel._dist_info
+    installed = [dest for _, dest, _ in layout.targets]
+    installed.extend(
+        _write_console_scripts(layout.entry_points, layout.scheme["scripts"])
+    )
+    (root / dist_info / "INSTALLER").write_text("metaflow_extensions\n")
+    installed.append(root / dist_info / "INSTALLER")
+    record = root / dist_info / "RECORD"
+    record.write_text(
+        "".join(f"{os.path.relpath(path, root)},,\n" for path in installed)
+        + f"{dist_info}/RECORD,,\n"
+    )
+
+
+def _unpack(path: Path, targets: Sequence[Tuple[str, Path, bool]]) -> None:
+    """Extract members of wheel at `path` to their destinations in `targets`."""
+    with zipfile.ZipFile(path) as zf:
+        for name, dest, is_script in targets:
+            info = zf.getinfo(name)
+            with zf.open(info) as src, open(dest, "wb") as dst:
+                if is_script:
+                    _copy_script(src, dst)
+                else:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            if is_script or info.external_attr >> 16 & 0o111:
+                dest.chmod(0o755)
+
+
+def _copy_script(src, dst) -> None:
+    """Copy script, pointing `#!python` shebangs at the current interpreter."""
+    first_line = src.readline()
+    if first_line.startswith(b"#!python"):
+        first_line = b"#!" + sys.executable.encode() + first_line[len(b"#!python") :]
+    dst.write(first_line)
+    shutil.copyfileobj(src, dst)
+
+
+def _write_console_scripts(entry_points: str, scripts: Path) -> List[Path]:
+    """Write wrapper scripts for the `console_scripts` in `entry_points`."""
+    import configparser
+
+    parser = configparser.ConfigParser(delimiters=("=",))
+    parser.optionxform = str  # Preserve case of script names
+    parser.read_string(entry_points)
+    if not parser.has_section("console_scripts"):
+        return []
+
+    written = []
+    scripts.mkdir(parents=True, exist_ok=True)
+    for name, target in parser.items("console_scripts"):
+        module, _, attr = target.partition(":")
+        attr = attr.split("[")[0].strip()  # Drop extras
+        path = scripts / name
+        path.write_text(
+            f"#!{sys.executable}\n"
+            "import sys\n"
+            f"from {module.strip()} import {attr.split('.')[0]}\n"
+            "if __name__ == '__main__':\n"
+            f"    sys.exit({attr}())\n"
+        )
+        path.chmod(0o755)
+        written.append(path)
+    return written
+
+
+INSTALLERS = {"pip": PipInstaller, "wheel": WheelInstaller}
@@ -0,0 +1,156 @@
+"""Zero-copy, memory-mapped artifacts.
+
+Metaflow pickles artifacts in-band, so large arrays/DataFrames are copied
+several times when saved and every task that loads them deserializes a
+private copy.
+
+Wrapping a value in `MmapArtifact` pickles it with protocol 5 and writes its
+out-of-band buffers (e.g. the data of NumPy arrays, pandas DataFrames and
+Arrow tables) as raw files in the flow's content-addressed store. Only a
+small reference is stored in the artifact itself. On load, the buffers are
+memory-mapped read-only:
+- from the datastore directly for the local datastore
+- from a local cache under `METAFLOW_CLIENT_CACHE_PATH` otherwise (each
+  buffer is downloaded once per host)
+so tasks on the same host share pages instead of each holding a copy.
+
+Loaded buffers are read-only, e.g. loaded NumPy arrays have
+`flags.writeable == False`. Copy the value if it needs to be modified.
+
+This module is imported at Metaflow's top-level so must not import Metaflow
+at module level.
+"""
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+
+class MmapArtifact(object):
+    """Wrap `value` to store it as a zero-copy, memory-mapped artifact.
+
+    To use, wrap the value when assigning the artifact:
+    ```python
+    from metaflow import MmapArtifact
+
+    @step
+    def start(self):
+        self.table = MmapArtifact(np.zeros((10_000, 10_000)))
+        self.next(self.process, foreach="chunks")
+
+    @step
+    def process(self):
+        table = self.table.value  # Read-only, memory-mapped
+    ```
+
+    Passing a loaded `MmapArtifact` through to subsequent steps does not
+    write its buffers again, unless its `value` is reassigned.
+
+    Parameters:
+        value (Any): Object to store, should support pickle protocol 5
+          out-of-band buffers for any benefit to be had.
+    """
+
+    def __init__(self, value: Any):  # noqa: D107
+        # Reference to already stored buffers, set when loaded from a datastore
+        self._ref: Optional[Tuple] = None
+        self.value = value
+
+    @property
+    def value(self) -> Any:
+        """The wrapped value."""
+        return self._value
+
+    @value.setter
+    def value(self, value: Any) -> None:
+        self._value = value
+        # The stored buffers are of the previous value
+        self._ref = None
+
+    def __reduce__(self):
+        """Store out-of-band buffers and pickle a reference to them."""
+        if self._ref is None:
+            self._ref = _save(self.value)
+        return (_load, self._ref)
+
+
+def _save(value: Any) -> Tuple[str, str, str, bytes, List[str]]:
+    """Save buffers of `value` in the current task's content-addressed store."""
+    from metaflow import current
+    from metaflow.datastore import FlowDataStore
+    from metaflow.exception import MetaflowException
+
+    if pickle.HIGHEST_PROTOCOL < 5:
+        raise MetaflowException("MmapArtifact requires Python 3.8 or newer.")
+
+    storage_impl = FlowDataStore.default_storage_impl
+    if storage_impl is None or current.flow_name is None:
+        raise MetaflowException("MmapArtifact can only be saved by a running task.")
+
+    buffers = []
+    meta = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+    flow_datastore = FlowDataStore(current.flow_name, None)
+    results = flow_datastore.ca_store.save_blobs(
+        (buffer.raw() for buffer in buffers), raw=True, len_hint=len(buffers)
+    )
+    return (
+        storage_impl.TYPE,
+        storage_impl.datastore_root,
+        current.flow_name,
+        meta,
+        [result.key for result in results],
+    )
+
+
+def _load(
+    ds_type: str, ds_root: str, flow_name: str, meta: bytes, keys: List[str]
+) -> MmapArtifact:
+    """Rebuild a `MmapArtifact` on top of memory-mapped buffers."""
+    from metaflow.datastore import DATASTORES
+
+    storage = DATASTORES[ds_type](ds_root)
+    buffers = [_mmap(_local_path(storage, flow_name, key)) for key in keys]
+    artifact = MmapArtifact(pickle.loads(meta, buffers=buffers))  # noqa: S301
+    artifact._ref = (ds_type, ds_root, flow_name, meta, keys)
+    return artifact
+
+
+def cas_path(storage, flow_name: str, key: str) -> str:
+    """Path of the blob at `key` in the content-addressed store of `flow_name`."""
+    # Mirrors the layout of `ContentAddressedStore`
+    return storage.path_join(flow_name, "data", key[:2], key)
+
+
+def _local_path(storage, flow_name: str, key: str) -> Path:
+    """Local path of the buffer stored at `key`, downloading it if needed."""
+    from metaflow.metaflow_config import CLIENT_CACHE_PATH
+
+    path = cas_path(storage, flow_name, key)
+    if storage.TYPE == "local":
+        return Path(storage.full_uri(path))
+
+    cache_path = Path(CLIENT_CACHE_PATH) / "mmap" / key[:2] / key
+    if not cache_path.exists():
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with storage.load_bytes([path]) as loaded:
+            for _, local_path, _ in loaded:
+                if local_path is None:
+                    raise FileNotFoundError(storage.full_uri(path))
+                # Download next to the cache entry then atomically move it in
+                # place, so concurrent tasks never map a partial file.
+                fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent)
+                os.close(fd)
+                shutil.copyfile(local_path, tmp_path)
+                os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def _mmap(path: Path) -> memoryview:
+    """Memory-map `path` read-only."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:  # Empty files can't be mapped
+            return memoryview(b"")
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
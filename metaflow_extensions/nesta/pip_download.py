@@ -0,0 +1,229 @@
+"""Parallel download of `@pip` requirements with structured progress.
+
+`pip install` downloads (and builds) requirements one at a time and, as
+`@pip` doesn't show its output, a task spending minutes installing
+requirements gives no clue as to why. Instead, `fetch`:
+1. Resolves the requirements that need installing with
+   `pip install --dry-run --report` (without downloading them)
+2. Downloads them in parallel, verifying their hashes
+3. Builds source distributions into wheels in parallel
+
+Each stage prints structured progress (JSON after a `@pip ` prefix) to the
+task log - bytes fetched (periodically for large files), where from, and how
+long each package took to download and build - and `fetch` returns a summary
+that `@pip` stores as task metadata. Requirements are then installed from
+the downloaded wheels without hitting the package index.
+
+Requirements that can't be downloaded up front (e.g. local directories, VCS
+URLs) raise `UnsupportedDownloadError` before anything is downloaded.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+from urllib.parse import unquote, urlparse
+
+# Seconds between progress events of a single download
+PROGRESS_INTERVAL = 5
+
+CHUNK_SIZE = 1024 * 1024
+
+_print_lock = threading.Lock()
+
+
+class UnsupportedDownloadError(Exception):
+    """Requirements can't be downloaded up front, e.g. local directories."""
+
+
+class Download(NamedTuple):
+    """Distribution to download."""
+
+    name: str
+    version: str
+    url: str
+    sha256: Optional[str]
+
+    @property
+    def filename(self) -> str:
+        """File name of the distribution."""
+        return unquote(os.path.basename(urlparse(self.url).path))
+
+
+def log_event(event: Dict[str, Any]) -> None:
+    """Print a progress `event` to the task log."""
+    with _print_lock:
+        print(f"@pip {json.dumps(event)}", flush=True)
+
+
+def fetch(
+    executable: str,
+    requirement_args: Sequence[str],
+    path: Path,
+    max_workers: Optional[int] = None,
+    report: Callable[[Dict[str, Any]], None] = log_event,
+) -> Dict[str, Any]:
+    """Download (and build) wheels of `requirement_args` to `path`.
+
+    Args:
+        executable: Python executable the requirements are for.
+        requirement_args: `pip install` requirement arguments.
+        path: Directory to download wheels to.
+        max_workers: Maximum number of concurrent downloads and builds,
+            defaults to `METAFLOW_PIP_DOWNLOAD_MAX_WORKERS`.
+        report: Called with each progress event.
+
+    Returns:
+        Summary of the time taken to resolve, download and build, the number
+        of bytes downloaded, and details of each package.
+    """
+    from metaflow_extensions.nesta.config.metaflow_config import (
+        PIP_DOWNLOAD_MAX_WORKERS,
+    )
+
+    max_workers = max_workers or int(PIP_DOWNLOAD_MAX_WORKERS)
+    start = time.time()
+    downloads = resolve(executable, requirement_args)
+    resolve_seconds = time.time() - start
+    report(
+        {
+            "event": "resolved",
+            "packages": [f"{d.name}=={d.version}" for d in downloads],
+            "seconds": round(resolve_seconds, 2),
+        }
+    )
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        packages = list(executor.map(lambda d: download(d, path, report), downloads))
+        download_seconds = time.time() - start
+
+        start = time.time()
+        builds = [package for package in packages if not _is_wheel(package["file"])]
+        build_times = list(
+            executor.map(lambda p: build(executable, path, p, report), builds)
+        )
+        for i, package in enumerate(builds):
+            package["build_seconds"] = round(build_times[i], 2)
+        build_seconds = time.time() - start
+
+    return {
+        "resolve_seconds": round(resolve_seconds, 2),
+        "download_seconds": round(download_seconds, 2),
+        "build_seconds": round(build_seconds, 2),
+        "bytes": sum(package["bytes"] for package in packages),
+        "packages": packages,
+    }
+
+
+def resolve(executable: str, requirement_args: Sequence[str]) -> List[Download]:
+    """Distributions to download to install `requirement_args`."""
+    process = subprocess.run(  # noqa: S603
+        [
+            executable,
+            "-m",
+            "pip",
+            "install",
+            "--dry-run",
+            "--quiet",
+            "--report",
+            "-",
+            *requirement_args,
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    downloads = []
+    for item in json.loads(process.stdout)["install"]:
+        info, metadata = item["download_info"], item["metadata"]
+        if "archive_info" not in info:  # e.g. local directories or VCS
+            raise UnsupportedDownloadError(
+                f"Can't download {metadata['name']} from {info['url']}"
+            )
+        hashes = info["archive_info"].get("hashes", {})
+        downloads.append(
+            Download(
+                metadata["name"], metadata["version"], info["url"], hashes.get("sha256")
+            )
+        )
+    return downloads
+
+
+def download(
+    dist: Download, path: Path, report: Callable[[Dict[str, Any]], None] = log_event
+) -> Dict[str, Any]:
+    """Download `dist` to `path`, verifying its hash."""
+    from urllib.request import urlopen
+
+    start = last_report = time.time()
+    sha256 = hashlib.sha256()
+    size = 0
+    tmp_path = path / f".{dist.filename}.partial"
+    with urlopen(dist.url) as response, open(tmp_path, "wb") as f:  # noqa: S310
+        total = response.headers.get("Content-Length")
+        for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+            f.write(chunk)
+            sha256.update(chunk)
+            size += len(chunk)
+            if time.time() - last_report > PROGRESS_INTERVAL:
+                last_report = time.time()
+                report(
+                    {
+                        "event": "progress",
+                        "package": dist.name,
+                        "bytes": size,
+                        "total": int(total) if total else None,
+                    }
+                )
+    if dist.sha256 is not None and sha256.hexdigest() != dist.sha256:
+        tmp_path.unlink()
+        raise ValueError(f"Hash mismatch for {dist.url}")
+    os.replace(tmp_path, path / dist.filename)
+
+    seconds = time.time() - start
+    package = {
+        "name": dist.name,
+        "version": dist.version,
+        "file": dist.filename,
+        "host": urlparse(dist.url).netloc,
+        "bytes": size,
+        "seconds": round(seconds, 2),
+    }
+    report({"event": "downloaded", **package})
+    return package
+
+
+def build(
+    executable: str,
+    path: Path,
+    package: Dict[str, Any],
+    report: Callable[[Dict[str, Any]], None] = log_event,
+) -> float:
+    """Build the source distribution of `package` in `path` into a wheel."""
+    from metaflow_extensions.nesta.utils import pip
+
+    start = time.time()
+    sdist = path / package["file"]
+    pip(
+        executable,
+        "wheel",
+        "--no-deps",
+        "--quiet",
+        "--wheel-dir",
+        str(path),
+        str(sdist),
+        stdout=subprocess.DEVNULL,
+    )
+    sdist.unlink()  # Only install the wheel
+    seconds = time.time() - start
+    report({"event": "built", "package": package["name"], "seconds": round(seconds, 2)})
+    return seconds
+
+
+def _is_wheel(filename: str) -> bool:
+    return filename.endswith(".whl")
@@ -0,0 +1,198 @@
+"""Background prefetching of `@pip` environments.
+
+While a step runs locally, the `@pip` requirements of its successor steps are
+built into wheels (`pip wheel`) in a detached background process. Building
+wheels never touches the current environment. When a successor step starts,
+`@pip` installs from the prefetched wheels without hitting the index.
+
+Wheels for a set of requirements live in `METAFLOW_PIP_PREFETCH_PATH/<key>`
+where `<key>` hashes the requirements (including the contents of requirements
+files and of the files they include with `-r`/`-c`), the Python version and
+the platform. A lock file per key ensures
+concurrent tasks (e.g. foreach tasks) build each set of requirements once and
+that a step starting mid-build waits for the build rather than duplicating it.
+
+After prefetching, the background process deletes wheelhouses that haven't
+been used for `METAFLOW_PIP_PREFETCH_MAX_AGE` days (unless being built or
+installed from).
+
+Run as `python -m metaflow_extensions.nesta.pip_prefetch <workers> <json>`
+where `<json>` is a list of requirement argument lists.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Set
+
+# Options of requirements files that include other files
+INCLUDE_OPTIONS = ("-r", "--requirement", "-c", "--constraint")
+
+
+def requirements_key(requirement_args: Sequence[str]) -> str:
+    """Hash of `requirement_args` for this Python version and platform."""
+    sha = hashlib.sha1()  # noqa: S303 - not used for security
+    sha.update(sys.version.encode())
+    sha.update(platform.platform().encode())
+    seen: Set[Path] = set()
+    for arg in requirement_args:
+        sha.update(arg.encode())
+        if os.path.isfile(arg):  # e.g. `-r requirements.txt`
+            _hash_requirements_file(sha, Path(arg), seen)
+    return sha.hexdigest()
+
+
+def _hash_requirements_file(sha, path: Path, seen: Set[Path]) -> None:
+    """Hash the contents of `path` and of the files it includes."""
+    path = path.resolve()
+    if path in seen:
+        return
+    seen.add(path)
+    content = path.read_bytes()
+    sha.update(content)
+    for line in content.decode(errors="replace").splitlines():
+        parts = line.split(" #")[0].split()
+        if len(parts) == 2 and parts[0] in INCLUDE_OPTIONS:
+            # Relative to the including file, as with pip
+            included = path.parent / parts[1]
+            if included.is_file():
+                _hash_requirements_file(sha, included, seen)
+
+
+def wheelhouse_path(requirement_args: Sequence[str]) -> Path:
+    """Where wheels for `requirement_args` are prefetched to."""
+    from metaflow_extensions.nesta.config.metaflow_config import PIP_PREFETCH_PATH
+
+    return Path(PIP_PREFETCH_PATH) / requirements_key(requirement_args)
+
+
+@contextmanager
+def _lock(path: Path, blocking: bool = True) -> Iterator[bool]:
+    """Exclusive lock on `path`, yields whether it was acquired."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{path}.lock", "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def prefetched_wheelhouse(requirement_args: Sequence[str]) -> Optional[Path]:
+    """Prefetched wheels for `requirement_args`, waiting for in-progress builds."""
+    path = wheelhouse_path(requirement_args)
+    if not Path(f"{path}.lock").exists():
+        return None
+    with _lock(path):
+        if not path.is_dir():
+            return None
+        os.utime(path)  # Mark as used, see `cleanup`
+        return path
+
+
+def prefetch(requirement_args: Sequence[str]) -> Optional[Path]:
+    """Build wheels for `requirement_args` unless already built or building."""
+    from metaflow_extensions.nesta.utils import pip
+
+    path = wheelhouse_path(requirement_args)
+    with _lock(path, blocking=False) as acquired:
+        if not acquired or path.is_dir():
+            return None
+
+        partial = Path(f"{path}.partial")
+        shutil.rmtree(partial, ignore_errors=True)
+        try:
+            pip(
+                sys.executable,
+                "wheel",
+                "--quiet",
+                "--wheel-dir",
+                str(partial),
+                *requirement_args,
+                stdout=subprocess.DEVNULL,
+            )
+        except subprocess.CalledProcessError:
+            logging.warning(f"Failed to prefetch {requirement_args}.")
+            shutil.rmtree(partial, ignore_errors=True)
+            return None
+        os.rename(partial, path)
+        return path
+
+
+def start_prefetch(requirement_args_list: List[List[str]], cwd: os.PathLike) -> None:
+    """Prefetch each of `requirement_args_list` in a detached process."""
+    from metaflow_extensions.nesta.config.metaflow_config import (
+        PIP_PREFETCH_MAX_WORKERS,
+    )
+
+    if not requirement_args_list:
+        return
+    subprocess.Popen(  # noqa: S603
+        [
+            sys.executable,
+            "-m",
+            __name__,
+            str(PIP_PREFETCH_MAX_WORKERS),
+            json.dumps(requirement_args_list),
+        ],
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        # Outlive the task that started it
+        start_new_session=True,
+    )
+
+
+def cleanup(root: Path, max_age: float, now: Optional[float] = None) -> List[Path]:
+    """Delete wheelhouses in `root` unused for `max_age` seconds.
+
+    Args:
+        root: Directory of wheelhouses (`METAFLOW_PIP_PREFETCH_PATH`).
+        max_age: Seconds since last built or used after which a wheelhouse is
+            deleted.
+        now: Current time, defaults to `time.time()`.
+
+    Returns:
+        Wheelhouses deleted.
+    """
+    cutoff = (time.time() if now is None else now) - max_age
+    removed = []
+    for path in sorted(root.glob("*")):
+        if not path.is_dir() or path.stat().st_mtime >= cutoff:
+            continue
+        # Skip wheelhouses being built or installed from. Lock files are left
+        # in place as other processes may be waiting on them.
+        with _lock(root / path.name.split(".")[0], blocking=False) as acquired:
+            if acquired:
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path)
+    return removed
+
+
+def main(max_workers: int, requirement_args_list: List[List[str]]) -> None:
+    """Prefetch `requirement_args_list` with bounded concurrency, then clean up."""
+    from metaflow_extensions.nesta.config.metaflow_config import (
+        PIP_PREFETCH_MAX_AGE,
+        PIP_PREFETCH_PATH,
+    )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(prefetch, requirement_args_list))
+    cleanup(Path(PIP_PREFETCH_PATH), float(PIP_PREFETCH_MAX_AGE) * 24 * 60 * 60)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]), json.loads(sys.argv[2]))
@@ -0,0 +1,300 @@
+"""Implements a CLI command to report artifact sizes and serialization costs.
+
+Usage:
+```
+python flow.py artifacts report [--run-id RUN_ID ...] [--json]
+```
+
+Implementation notes:
+- Tasks are read straight from the flow datastore (not the metadata service)
+  so that the report works against the local datastore.
+- Runs are visited one at a time and artifacts are loaded one at a time,
+  results are echoed as soon as they are computed. Only the content keys of
+  the run being reported are held in memory, so histories with thousands of
+  runs do not need to fit in memory.
+- "Transfer volume" is the size of the (compressed) blob in the
+  content-addressed store, i.e. what is moved over the wire when an artifact
+  is saved or loaded.
+- The out-of-band buffers of a `MmapArtifact` are stored as separate blobs,
+  their sizes are added to both the size and the transfer volume of the
+  artifact. Their keys are read by unpickling the artifact's reference
+  without mapping (or downloading) the buffers themselves.
+- An artifact is flagged as a copy when a task stores the same content key
+  under the same name as a task of an upstream step (an ancestor in the flow
+  graph) of the same run. Identical artifacts of sibling tasks (e.g. foreach
+  tasks) or of parallel branches are not copies of each other.
+"""
+
+import json
+import pickle
+import time
+from collections import defaultdict
+from io import BytesIO
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from metaflow._vendor import click
+
+from metaflow_extensions.nesta.mmap_artifact import cas_path, MmapArtifact
+from metaflow_extensions.nesta.utils import human_bytes
+
+
+class ArtifactStats(NamedTuple):
+    """Size and serialization cost of one artifact of one task."""
+
+    run_id: str
+    step_name: str
+    task_id: str
+    foreach_index: Optional[str]
+    name: str
+    size: int
+    transfer_size: Optional[int]
+    pickle_seconds: Optional[float]
+    unpickle_seconds: Optional[float]
+    copy_of: Optional[str]
+
+
+@click.group()
+def cli():  # noqa: D103
+    pass
+
+
+@cli.group(help="Commands related to artifacts.")
+def artifacts():  # noqa: D103
+    pass
+
+
+@artifacts.command(help="Report artifact sizes and serialization costs.")
+@click.option(
+    "--run-id",
+    "run_ids",
+    multiple=True,
+    help="Run(s) to report on. Defaults to every run in the datastore.",
+)
+@click.option(
+    "--timings/--no-timings",
+    default=True,
+    show_default=True,
+    help="Measure pickle/unpickle time (loads every artifact).",
+)
+@click.option(
+    "--private/--no-private",
+    default=False,
+    show_default=True,
+    help="Include Metaflow's private artifacts (e.g. `_foreach_stack`).",
+)
+@click.option(
+    "--json", "as_json", is_flag=True, default=False, help="Output JSON lines."
+)
+@click.pass_obj
+def report(obj, run_ids, timings, private, as_json):  # noqa: D103
+    flow_datastore = obj.flow_datastore
+    if not run_ids:
+        run_ids = list_run_ids(flow_datastore)
+    ancestors = step_ancestors(obj.graph)
+
+    for run_id in run_ids:
+        totals = defaultdict(lambda: [0, 0, 0.0, 0.0, 0])
+        for stats in run_artifact_stats(
+            flow_datastore, run_id, ancestors, timings, private
+        ):
+            step_total = totals[stats.step_name]
+            step_total[0] += stats.size
+            step_total[1] += stats.transfer_size or 0
+            step_total[2] += stats.pickle_seconds or 0
+            step_total[3] += stats.unpickle_seconds or 0
+            step_total[4] += stats.copy_of is not None
+            click.echo(json.dumps(stats._asdict()) if as_json else format_stats(stats))
+
+        if as_json:
+            continue
+        for step_name, (size, transfer, dump, load, copies) in totals.items():
+            click.echo(
+                f"{run_id}/{step_name} TOTAL size={human_bytes(size)}"
+                f" transfer={human_bytes(transfer)} pickle={dump:.3f}s"
+                f" unpickle={load:.3f}s copies={copies}"
+            )
+
+
+def list_run_ids(flow_datastore) -> List[str]:
+    """Run ids present in `flow_datastore`, most recent first."""
+    # Breaks the FlowDataStore abstraction as there is no public listing API
+    storage = flow_datastore._storage_impl
+    run_ids = [
+        storage.basename(result.path)
+        for result in storage.list_content([flow_datastore.flow_name])
+        if not result.is_file and storage.basename(result.path) != "data"
+    ]
+    return sorted(run_ids, key=_run_sort_key, reverse=True)
+
+
+def _run_sort_key(run_id: str) -> Tuple[int, str]:
+    # Local run ids are timestamps, others (e.g. `sfn-*`) are ordered lexically
+    return (int(run_id), "") if run_id.isdigit() else (-1, run_id)
+
+
+def step_ancestors(graph) -> Dict[str, Set[str]]:
+    """Steps upstream of each step of a `FlowGraph`."""
+    ancestors: Dict[str, Set[str]] = {}
+
+    def _ancestors(step_name: str) -> Set[str]:
+        if step_name not in ancestors:
+            ancestors[step_name] = set()  # Guards against cycles
+            for parent in graph[step_name].in_funcs:
+                ancestors[step_name] |= {parent, *_ancestors(parent)}
+        return ancestors[step_name]
+
+    for node in graph:
+        _ancestors(node.name)
+    return ancestors
+
+
+def run_artifact_stats(
+    flow_datastore,
+    run_id: str,
+    ancestors: Dict[str, Set[str]],
+    timings: bool = True,
+    private: bool = False,
+) -> Iterator[ArtifactStats]:
+    """Yield `ArtifactStats` for every artifact of every task in `run_id`."""
+    task_datastores = flow_datastore.get_latest_task_datastores(run_id)
+
+    def _step_rank(task_datastore):
+        # A step has more ancestors than any of its ancestors, so this visits
+        # upstream steps first
+        step_ancestors = ancestors.get(task_datastore.step_name)
+        # Steps no longer in the flow go last
+        rank = len(ancestors) if step_ancestors is None else len(step_ancestors)
+        return (rank, task_datastore.step_name, task_datastore.task_id)
+
+    # (artifact name, content key) -> (step name, task pathspec) of each store
+    seen: Dict[Tuple[str, str], List[Tuple[str, str]]] = defaultdict(list)
+    for task_datastore in sorted(task_datastores, key=_step_rank):
+        yield from task_artifact_stats(
+            task_datastore,
+            seen,
+            ancestors.get(task_datastore.step_name, set()),
+            timings,
+            private,
+        )
+
+
+def task_artifact_stats(
+    task_datastore,
+    seen: Dict[Tuple[str, str], List[Tuple[str, str]]],
+    upstream: Set[str],
+    timings: bool = True,
+    private: bool = False,
+) -> Iterator[ArtifactStats]:
+    """Yield `ArtifactStats` for every artifact of `task_datastore`."""
+    # NOTE: `seen` is updated in place with the content keys of this task,
+    # `upstream` are the steps upstream of the task's step
+    flow_datastore = task_datastore.parent_datastore
+    storage = task_datastore._storage_impl
+    info = task_datastore.ds_metadata["info"]
+    names = [name for name in info if private or not name.startswith("_")]
+    foreach_index = _foreach_index(task_datastore)
+
+    for name in names:
+        (key,) = task_datastore.keys_for_artifacts([name])
+        size = info[name].get("size", 0)
+        transfer_size = storage.size_file(
+            cas_path(storage, flow_datastore.flow_name, key)
+        )
+        if info[name].get("type") == str(MmapArtifact):
+            buffers_size = sum(
+                storage.size_file(
+                    cas_path(storage, flow_datastore.flow_name, buffer_key)
+                )
+                or 0
+                for buffer_key in _buffer_keys(flow_datastore, key)
+            )
+            size += buffers_size
+            transfer_size = (transfer_size or 0) + buffers_size
+
+        origins = seen.setdefault((name, key), [])
+        # Identical content in sibling (e.g. foreach) tasks or parallel
+        # branches is not a copy
+        copy_of = next(
+            (pathspec for step_name, pathspec in origins if step_name in upstream),
+            None,
+        )
+        origins.append((task_datastore.step_name, task_datastore.pathspec))
+
+        pickle_seconds, unpickle_seconds = (
+            _time_serialization(flow_datastore, key, info[name])
+            if timings
+            else (None, None)
+        )
+        yield ArtifactStats(
+            run_id=task_datastore.run_id,
+            step_name=task_datastore.step_name,
+            task_id=task_datastore.task_id,
+            foreach_index=foreach_index,
+            name=name,
+            size=size,
+            transfer_size=transfer_size,
+            pickle_seconds=pickle_seconds,
+            unpickle_seconds=unpickle_seconds,
+            copy_of=copy_of,
+        )
+
+
+class _BufferKeysUnpickler(pickle.Unpickler):
+    """Unpickles a `MmapArtifact` to the keys of its buffers."""
+
+    def find_class(self, module: str, name: str):  # noqa: D102
+        if (module, name) == (MmapArtifact.__module__, "_load"):
+            return lambda ds_type, ds_root, flow_name, meta, keys: keys
+        return super().find_class(module, name)
+
+
+def _buffer_keys(flow_datastore, key: str) -> Set[str]:
+    """Content keys of the buffers of the `MmapArtifact` stored at `key`."""
+    _, blob = next(flow_datastore.ca_store.load_blobs([key]))
+    return set(_BufferKeysUnpickler(BytesIO(blob)).load())
+
+
+def _foreach_index(task_datastore) -> Optional[str]:
+    """Comma separated foreach indices of a task, `None` if not in a foreach."""
+    if "_foreach_stack" not in task_datastore:
+        return None
+    stack = task_datastore["_foreach_stack"]
+    return ",".join(str(frame.index) for frame in stack) if stack else None
+
+
+def _time_serialization(
+    flow_datastore, key: str, info: Dict
+) -> Tuple[Optional[float], Optional[float]]:
+    """Time unpickling then re-pickling the blob at `key`."""
+    protocol = 4 if info.get("encoding", "").endswith("v4") else 2
+    _, blob = next(flow_datastore.ca_store.load_blobs([key]))
+    try:
+        start = time.perf_counter()
+        obj = pickle.loads(blob)  # noqa: S301 - trusted datastore
+        unpickle_seconds = time.perf_counter() - start
+    except Exception:  # e.g. class of artifact not importable here
+        return None, None
+    del blob
+
+    start = time.perf_counter()
+    pickle.dumps(obj, protocol=protocol)
+    pickle_seconds = time.perf_counter() - start
+    return pickle_seconds, unpickle_seconds
+
+
+def format_stats(stats: ArtifactStats) -> str:
+    """Human readable, single line representation of `stats`."""
+    pathspec = f"{stats.run_id}/{stats.step_name}/{stats.task_id}"
+    if stats.foreach_index is not None:
+        pathspec += f"[{stats.foreach_index}]"
+    line = (
+        f"{pathspec} {stats.name} size={human_bytes(stats.size)}"
+        f" transfer={human_bytes(stats.transfer_size)}"
+    )
+    if stats.pickle_seconds is not None:
+        line += f" pickle={stats.pickle_seconds:.3f}s"
+    if stats.unpickle_seconds is not None:
+        line += f" unpickle={stats.unpickle_seconds:.3f}s"
+    if stats.copy_of is not None:
+        line += f" COPY OF {stats.copy_of}"
+    return line
@@ -0,0 +1,188 @@
+"""Implements a step decorator to checkpoint and resume long-running steps.
+
+Implementation notes:
+- Checkpoints are stored in the task's datastore location (next to its
+  artifacts, logs and metadata), under `_checkpoints/`. All attempts of a
+  task share this location, so a retry finds the checkpoints of previous
+  attempts.
+- Each `save` writes the pickled state to a new file, then (over)writes
+  `_checkpoints/latest.json` to point at it, then deletes the previous
+  checkpoint. A task dying mid-save therefore leaves the previous checkpoint
+  intact and pointed to.
+- StepDecorator.task_pre_step exposes a `Checkpoint` as `current.checkpoint`
+  and, if retrying (`retry_count > 0`), restores the latest checkpoint. A
+  checkpoint (or index) that can't be loaded is logged and ignored, so the
+  step starts from its default state.
+- StepDecorator.task_finished deletes the checkpoints once the task has
+  succeeded. Checkpoints of a task whose final attempt failed are kept.
+- The datastore abstraction has no delete operation, files are deleted
+  directly for the local and S3 datastores.
+"""
+import json
+import logging
+import pickle
+import time
+from io import BytesIO
+from typing import Any, Optional
+
+from metaflow.decorators import StepDecorator
+
+# Directory of checkpoints, relative to a task's datastore location
+CHECKPOINT_DIR = "_checkpoints"
+
+
+class CheckpointDecorator(StepDecorator):
+    """Step decorator to save intermediate state so that retries resume.
+
+    To use, add this decorator (and usually `@retry`) to your step and
+    periodically save the state needed to resume:
+    ```python
+    @retry
+    @checkpoint
+    @step
+    def train(self):
+        from metaflow import current
+
+        state = current.checkpoint.load(default={"epoch": 0, "model": None})
+        for epoch in range(state["epoch"], 100):
+            state["model"] = fit_one_epoch(state["model"])
+            state["epoch"] = epoch + 1
+            current.checkpoint.save(state)
+        self.model = state["model"]
+        self.next(self.end)
+    ```
+
+    On a retry, `current.checkpoint.load()` returns the state last saved by a
+    previous attempt. Checkpoints are deleted when the task succeeds.
+    """
+
+    name = "checkpoint"
+
+    defaults = {}
+
+    def task_pre_step(
+        self,
+        step_name,
+        task_datastore,
+        metadata,
+        run_id,
+        task_id,
+        flow,
+        graph,
+        retry_count,
+        max_user_code_retries,
+        ubf_context,
+        inputs,
+    ):
+        """Expose `current.checkpoint`, restoring the latest checkpoint on retries."""
+        from metaflow import current
+
+        storage = task_datastore._storage_impl
+        path = storage.path_join(flow.name, run_id, step_name, task_id, CHECKPOINT_DIR)
+        self._checkpoint = Checkpoint(storage, path, retry_count)
+        if retry_count > 0:
+            self._checkpoint.restore()
+        current._update_env({"checkpoint": self._checkpoint})
+
+    def task_finished(
+        self, step_name, flow, graph, is_task_ok, retry_count, max_user_code_retries
+    ):
+        """Delete checkpoints once the task has succeeded."""
+        if is_task_ok:
+            self._checkpoint.clear()
+
+
+class Checkpoint(object):
+    """Checkpoints of a task, available as `current.checkpoint` in user code.
+
+    Parameters:
+        storage (DataStoreStorage): Storage of the task's datastore.
+        path (str): Directory to store checkpoints in.
+        attempt (int): Current attempt of the task.
+    """
+
+    def __init__(self, storage, path: str, attempt: int):  # noqa: D107
+        self._storage = storage
+        self._path = path
+        self._attempt = attempt
+        self._saves = 0
+        self._latest: Optional[str] = None  # Name of the latest checkpoint
+        self._state: Any = None
+        self.restored = False  # Whether a previous attempt's state was restored
+
+    def save(self, state: Any) -> None:
+        """Save `state` (anything picklable) as the latest checkpoint."""
+        from metaflow_extensions.nesta.utils import delete_paths
+
+        name = f"{self._attempt}-{self._saves}.pkl"
+        self._saves += 1
+        start = time.time()
+        data = pickle.dumps(state, protocol=4)
+        self._storage.save_bytes(
+            [(self._storage.path_join(self._path, name), BytesIO(data))],
+            overwrite=True,
+        )
+        index = {"name": name, "attempt": self._attempt, "ts": time.time()}
+        self._storage.save_bytes(
+            [(self._index_path, BytesIO(json.dumps(index).encode()))], overwrite=True
+        )
+
+        previous, self._latest, self._state = self._latest, name, state
+        if previous is not None:
+            delete_paths(self._storage, [self._storage.path_join(self._path, previous)])
+        logging.info(
+            f"Saved checkpoint {name} ({len(data)} bytes) in {time.time() - start:.1f}s"
+        )
+
+    def load(self, default: Any = None) -> Any:
+        """State of the latest checkpoint, `default` if there is none."""
+        return self._state if self._latest is not None else default
+
+    def restore(self) -> bool:
+        """Load the latest checkpoint from the datastore, if any."""
+        index = self._load_bytes(self._index_path)
+        if index is None:
+            return False
+        # The index is overwritten in place so may be partially written
+        try:
+            name = json.loads(index)["name"]
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring invalid checkpoint index: {e!r}")
+            return False
+        data = self._load_bytes(self._storage.path_join(self._path, name))
+        if data is None:
+            return False
+        try:
+            state = pickle.loads(data)  # noqa: S301
+        except Exception as e:  # e.g. truncated, or class no longer importable
+            logging.warning(f"Ignoring checkpoint {name} that can't be loaded: {e!r}")
+            return False
+        self._latest, self._state = name, state
+        self.restored = True
+        print(f"Restored checkpoint {name}")
+        return True
+
+    def clear(self) -> None:
+        """Delete all checkpoints."""
+        from metaflow_extensions.nesta.utils import delete_paths
+
+        paths = [
+            result.path
+            for result in self._storage.list_content([self._path])
+            if result.is_file
+        ]
+        delete_paths(self._storage, paths)
+        self._latest, self._state = None, None
+
+    @property
+    def _index_path(self) -> str:
+        return self._storage.path_join(self._path, "latest.json")
+
+    def _load_bytes(self, path: str) -> Optional[bytes]:
+        with self._storage.load_bytes([path]) as loaded:
+            for _, local_path, _ in loaded:
+                if local_path is None:
+                    return None
+                with open(local_path, "rb") as f:
+                    return f.read()
+        return None
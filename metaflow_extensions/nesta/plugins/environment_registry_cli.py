@@ -0,0 +1,105 @@
+"""Implements CLI commands to inspect and clean up shared `@pip` environments.
+
+Usage:
+```
+python flow.py environments list [--json]
+python flow.py environments gc [--max-age DAYS] [--dry-run]
+```
+
+Implementation notes:
+- Environments are read from the registry in the datastore of the command
+  (e.g. `--datastore s3`), which is shared by every flow in the datastore
+  (see `env_registry`). Both commands act on all flows, not only `flow.py`.
+- `gc` first removes users (flow steps) that haven't used their environment
+  within `--max-age` days, then deletes builds of wheels not referenced by
+  any environment that are older than `--max-age` days, then environments
+  without any remaining users that haven't been used within `--max-age` days.
+"""
+import json
+import time
+from datetime import datetime
+
+from metaflow._vendor import click
+
+from metaflow_extensions.nesta.env_registry import Environment, EnvironmentRegistry
+from metaflow_extensions.nesta.utils import human_bytes
+
+DAY = 24 * 60 * 60
+
+
+@click.group()
+def cli():  # noqa: D103
+    pass
+
+
+@cli.group(help="Commands related to shared @pip environments.")
+def environments():  # noqa: D103
+    pass
+
+
+@environments.command(
+    name="list", help="List shared environments, most recently used first."
+)
+@click.option(
+    "--json", "as_json", is_flag=True, default=False, help="Output JSON lines."
+)
+@click.pass_obj
+def list_environments(obj, as_json):  # noqa: D103
+    registry = EnvironmentRegistry(obj.flow_datastore._storage_impl)
+    for env in registry.environments():
+        click.echo(
+            json.dumps({**env._asdict(), "refs": len(env.users)})
+            if as_json
+            else format_environment(env)
+        )
+
+
+@environments.command(
+    help="Delete environments and orphaned wheels unused for `--max-age` days."
+)
+@click.option(
+    "--max-age",
+    default=30,
+    show_default=True,
+    type=float,
+    help="Days after which users and unused environments are removed.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="Report what would be removed without removing anything.",
+)
+@click.pass_obj
+def gc(obj, max_age, dry_run):  # noqa: D103
+    registry = EnvironmentRegistry(obj.flow_datastore._storage_impl)
+    users, envs, builds = registry.gc(max_age * DAY, dry_run=dry_run)
+    prefix = "Would remove" if dry_run else "Removed"
+    for user in users:
+        click.echo(f"{prefix} user {user}")
+    for build in builds:
+        click.echo(f"{prefix} orphaned build {build}")
+    for env in envs:
+        click.echo(f"{prefix} environment {format_environment(env)}")
+    click.echo(
+        f"{prefix} {len(users)} users and {len(envs)} environments"
+        f" ({human_bytes(sum(env.size for env in envs))}),"
+        f" and {len(builds)} orphaned builds"
+    )
+
+
+def format_environment(env: Environment) -> str:
+    """Human readable, single line representation of `env`."""
+    return (
+        f"{env.key[:12]} ({human_bytes(env.size)}, {env.spec['python']}"
+        f" {env.spec['platform']}): refs={len(env.users)}"
+        f" last used={_format_time(env.last_used)}"
+        f" created={_format_time(env.created)}"
+        f" requirements={' '.join(env.spec['requirements']) or '-'}"
+        f" users={' '.join(sorted(env.users)) or '-'}"
+    )
+
+
+def _format_time(ts: float) -> str:
+    days = (time.time() - ts) / DAY
+    return f"{datetime.fromtimestamp(ts):%Y-%m-%d %H:%M} ({days:.0f}d ago)"
@@ -1,19 +1,26 @@
 """Define extensions for metaflow to import."""
 from typing import List
 
+from .checkpoint_decorator import CheckpointDecorator
 from .pip_step_decorator import PipStepDecorator
 from .preinstall_environment import PreinstallEnvironment
+from .resource_monitor import ResourceMonitor
+from .resource_monitor_decorator import ResourceMonitorDecorator
 
 
 FLOW_DECORATORS = []
-STEP_DECORATORS = [PipStepDecorator]
+STEP_DECORATORS = [PipStepDecorator, ResourceMonitorDecorator, CheckpointDecorator]
 ENVIRONMENTS = [PreinstallEnvironment]
 METADATA_PROVIDERS = []
 SIDECARS = {}
 LOGGING_SIDECARS = {}
-MONITOR_SIDECARS = {}
+MONITOR_SIDECARS = {ResourceMonitor.TYPE: ResourceMonitor}
 
 
 def get_plugin_cli() -> List:
     """Return list of click multi-commands to extend metaflow CLI."""
-    return []
+    from .artifact_report_cli import cli as artifact_report_cli
+    from .environment_registry_cli import cli as environment_registry_cli
+    from .resource_advisor_cli import cli as resource_advisor_cli
+
+    return [artifact_report_cli, resource_advisor_cli, environment_registry_cli]
@@ -4,15 +4,38 @@ Implementation notes:
 - StepDecorator.task_pre_step runs just before a step begins executing in the
   tasktime environment (not the runtime environment) - e.g. the function will
   run on batch, not on the machine orchestrating the batch run.
+- If `METAFLOW_PIP_PREFETCH` is "true", StepDecorator.runtime_init starts
+  building the `@pip` requirements of all locally run steps in the background
+  (see `pip_prefetch`), in the order the steps come in the flow graph.
+  StepDecorator.task_pre_step then installs from the prefetched requirements.
+- With `installer="wheel"`, requirements are installed in-process from local
+  wheels (prefetched wheels and/or the `wheels` directory) by
+  `installers.WheelInstaller`, falling back to `pip` for requirements it
+  can't satisfy from those wheels.
+- With `download=True`, unless installing from local wheels, requirements
+  are downloaded (and built) in parallel up front by `pip_download.fetch`,
+  which streams structured progress to the task log, then installed from the
+  downloaded wheels. This costs an extra `pip` resolve so is opt-in. A
+  summary (time to resolve, download, build and install, bytes downloaded
+  per package) is stored as task metadata named "pip-install".
+- With `shared=True`, the wheels of the step's environment are looked up in
+  (or built and published to) the datastore's registry of environments
+  shared across flows (see `env_registry`) and installed from.
 - StepDecorator.task_post_step and StepDecorators.task_exception delete the
   `conda.dependencies` file for the flow in the local `.metaflow` store if the
   step that just ran was run locally in a conda environment. This ensures that
   subsequent steps that use the same conda environment are not polluted by
   this decorator.
 """
+import json
+import logging
+import os
+import subprocess
 import sys
+import tempfile
+import time
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
 from metaflow.decorators import StepDecorator
 from metaflow.exception import MetaflowException
@@ -49,17 +72,94 @@ class PipStepDecorator(StepDecorator):
           version constraints).
         safe (bool): If False, Conda environments won't be safely recreated on
           the local runtime to avoid polluted environments.
+        compile (bool): If True, installed packages are byte-compiled up front
+          (in parallel across cores) rather than on first import.
+        installer (str): Installer backend, one of `installers.INSTALLERS`:
+          "pip" (default) or "wheel" to install in-process from local wheels.
+        wheels (Path): Relative path (compared to flow file) to a directory of
+          wheels to install from instead of the package index.
+        download (bool): If True, requirements are downloaded in parallel
+          (reporting progress in the task log) before being installed. Off by
+          default as resolving what to download is an extra `pip` run.
+        shared (bool): If True, install from an environment shared by all
+          flows in the datastore with the same requirements, building and
+          publishing it if it doesn't exist yet (see `env_registry`).
     """
 
     name = "pip"
 
-    defaults = {"path": None, "libraries": None, "safe": "true"}
+    defaults = {
+        "path": None,
+        "libraries": None,
+        "safe": "true",
+        "compile": "true",
+        "installer": "pip",
+        "wheels": None,
+        "download": "false",
+        "shared": "false",
+    }
+
+    # Run ID prefetching was started for, prefetching is started once per run
+    _prefetch_run_id = None
 
     @property
     def is_safe_mode(self):
         """Is the decorator used in safe mode?"""
         return False if self.attributes["safe"] in [False, "false"] else True
 
+    @property
+    def is_compile_mode(self):
+        """Is the decorator used in compile mode?"""
+        return False if self.attributes["compile"] in [False, "false"] else True
+
+    @property
+    def is_shared_mode(self):
+        """Is the decorator used in shared mode?"""
+        return False if self.attributes["shared"] in [False, "false"] else True
+
+    @property
+    def is_download_mode(self):
+        """Is the decorator used in download mode?"""
+        return False if self.attributes["download"] in [False, "false"] else True
+
+    def step_init(
+        self, flow, graph, step_name, decorators, environment, flow_datastore, logger
+    ):
+        """Validate the installer backend."""
+        from metaflow_extensions.nesta.installers import INSTALLERS
+
+        if self.attributes["installer"] not in INSTALLERS:
+            raise MetaflowException(
+                f"@pip installer should be one of {set(INSTALLERS)}, got"
+                f" {self.attributes['installer']!r}"
+            )
+
+    def runtime_init(self, flow, graph, package, run_id):
+        """Start prefetching `@pip` requirements of local steps in the background."""
+        from metaflow.metaflow_config import DEFAULT_ENVIRONMENT
+        from metaflow_extensions.nesta.pip_prefetch import start_prefetch
+        from metaflow_extensions.nesta.utils import (
+            graph_step_order,
+            is_mflow_conda_environment,
+        )
+
+        if not is_prefetch_mode() or PipStepDecorator._prefetch_run_id == run_id:
+            return
+        PipStepDecorator._prefetch_run_id = run_id
+
+        # Wheels are built for the runtime's Python so can't be used by steps
+        # running in another (Conda) environment or remotely.
+        if is_mflow_conda_environment(sys.argv, DEFAULT_ENVIRONMENT):
+            print("@pip prefetching is not supported with Conda environments")
+            return
+        flow_dir = Path(os.path.abspath(sys.argv[0])).parent
+        requirement_args = (
+            pip_requirement_args(graph[step_name].decorators, flow_dir)
+            for step_name in graph_step_order(graph)
+            if not any(d.name in REMOTE_DECORATORS for d in graph[step_name].decorators)
+        )
+        start_prefetch(list(filter(None, requirement_args)), cwd=flow_dir)
+
     def task_pre_step(
         self,
         step_name,
@@ -75,9 +175,10 @@ class PipStepDecorator(StepDecorator):
         inputs,
     ):
         """Install packages with pip."""
+        from metaflow.metadata import MetaDatum
         from metaflow_extensions.nesta.utils import ch_dir
 
-        flow_dir = Path(sys.argv[0]).parent
+        flow_dir = Path(os.path.abspath(sys.argv[0])).parent
         path = (flow_dir / self.attributes["path"]) if self.attributes["path"] else None
         libraries = self.attributes["libraries"]
         path_mode = path is not None
@@ -89,12 +190,51 @@ class PipStepDecorator(StepDecorator):
                 "following arguments: {path, libraries}"
             )
 
-        if path_mode:
-            with ch_dir(flow_dir):
-                pip_install_reqs(path)
-
-        if library_mode:
-            pip_install_libraries(libraries)
+        prefetch = is_prefetch_mode() and is_task_local()
+        installer = self.attributes["installer"]
+        wheels = (
+            (flow_dir / self.attributes["wheels"])
+            if self.attributes["wheels"]
+            else None
+        )
+
+        with tempfile.TemporaryDirectory() as shared_wheels:
+            shared = {}
+            if self.is_shared_mode and wheels is None:
+                with ch_dir(flow_dir):
+                    shared = _shared_wheelhouse(
+                        pip_requirement_args([self], flow_dir),
+                        Path(os.path.abspath(sys.argv[0])),
+                        flow.name,
+                        step_name,
+                        task_datastore._storage_impl,
+                        Path(shared_wheels),
+                    )
+                if shared:
+                    wheels = Path(shared_wheels)
+
+            args = (self.is_compile_mode, prefetch, installer, wheels)
+            if path_mode:
+                with ch_dir(flow_dir):
+                    summary = pip_install_reqs(path, *args, self.is_download_mode)
+
+            if library_mode:
+                summary = pip_install_libraries(libraries, *args, self.is_download_mode)
+        summary.update(shared)
+
+        metadata.register_metadata(
+            run_id,
+            step_name,
+            task_id,
+            [
+                MetaDatum(
+                    field=METADATA_FIELD,
+                    value=json.dumps(summary),
+                    type=METADATA_FIELD,
+                    tags=[f"attempt_id:{retry_count}"],
+                )
+            ],
+        )
 
     def task_post_step(
         self, step_name, flow, graph, retry_count, max_user_code_retries
@@ -118,12 +258,7 @@ def ensure_conda_integrity(
     from metaflow.metaflow_config import DEFAULT_ENVIRONMENT
     from metaflow_extensions.nesta.utils import is_mflow_conda_environment
 
-    def _is_task_local():
-        from metaflow import __path__ as metaflow_path
-
-        return not (metaflow_path == "/metaflow/metaflow")
-
-    if _is_task_local() and is_mflow_conda_environment(sys.argv, DEFAULT_ENVIRONMENT):
+    if is_task_local() and is_mflow_conda_environment(sys.argv, DEFAULT_ENVIRONMENT):
         step_decorators = graph.nodes[step_name].decorators
         # Triggers re-creation of Conda env after extra installation actions
         # has possibly 'polluted' it.
@@ -138,6 +273,36 @@ def ensure_conda_integrity(
     return
 
 
+def is_task_local() -> bool:
+    """True if the current task runs locally rather than remotely, e.g. Batch."""
+    from metaflow import __path__ as metaflow_path
+
+    return not (metaflow_path == "/metaflow/metaflow")
+
+
+def is_prefetch_mode() -> bool:
+    """Is background prefetching of `@pip` requirements enabled?"""
+    from metaflow_extensions.nesta.config.metaflow_config import PIP_PREFETCH
+
+    return PIP_PREFETCH in [True, "true", "True", "1"]
+
+
+def pip_requirement_args(
+    step_decorators: List[StepDecorator], flow_dir: Path
+) -> Optional[Tuple[str, ...]]:
+    """`pip install` requirement arguments of a step's `@pip` decorator if any."""
+    pip_decorator = next(
+        (d for d in step_decorators if isinstance(d, PipStepDecorator)), None
+    )
+    if pip_decorator is None:
+        return None
+    if pip_decorator.attributes["path"]:
+        return reqs_args(flow_dir / pip_decorator.attributes["path"])
+    if pip_decorator.attributes["libraries"]:
+        return libraries_args(pip_decorator.attributes["libraries"])
+    return None
+
+
 def clear_local_conda_cache(
     flow_name: str, step_decorators: List[StepDecorator]
 ) -> None:
@@ -156,6 +321,12 @@ def clear_local_conda_cache(
     return
 
 
+# Name and type of the task metadata install summaries are stored in
+METADATA_FIELD = "pip-install"
+
+# Decorators of steps that run in remote compute environments
+REMOTE_DECORATORS = {"batch", "kubernetes"}
+
 # https://www.python.org/dev/peps/pep-0440/#version-specifiers
 PKG_CONSTRAINT_OPS = {"==", ">=", "<=", "<", ">", "~=", "!="}
 
@@ -168,25 +339,209 @@ def fill_constraint(pkg_version: str) -> str:
         return pkg_version
 
 
-def pip_install_libraries(libraries: Dict[str, str]) -> None:
-    """Install `libraries` with `pip`."""
-    from metaflow_extensions.nesta.utils import pip_install
-
-    pip_install(
-        sys.executable, tuple(k + fill_constraint(v) for k, v in libraries.items())
+def libraries_args(libraries: Dict[str, str]) -> Tuple[str, ...]:
+    """`pip install` requirement arguments for `libraries`."""
+    return tuple(k + fill_constraint(v) for k, v in libraries.items())
+
+
+def reqs_args(path: Path) -> Tuple[str, ...]:
+    """`pip install` requirement arguments for requirements file at `path`."""
+    return ("-r", str(path))
+
+
+def pip_install_libraries(
+    libraries: Dict[str, str],
+    compile_bytecode: bool = True,
+    prefetch: bool = False,
+    installer: str = "pip",
+    wheels: Optional[Path] = None,
+    download: bool = False,
+) -> Dict[str, Any]:
+    """Install `libraries` with `pip` (or `installer`), returning a summary."""
+    installed = _installed_distributions() if compile_bytecode else set()
+    summary = _install(libraries_args(libraries), prefetch, installer, wheels, download)
+    if compile_bytecode:
+        _compile_bytecode(installed)
+    return summary
+
+
+def _install(
+    requirement_args: Sequence[str],
+    prefetch: bool,
+    installer: str,
+    wheels: Optional[Path],
+    download: bool = False,
+) -> Dict[str, Any]:
+    """Install and check `requirement_args`, from local wheels where possible."""
+    from metaflow_extensions.nesta.pip_download import log_event
+    from metaflow_extensions.nesta.pip_prefetch import prefetched_wheelhouse
+
+    find_links = [wheels] if wheels is not None else []
+    wheelhouse = prefetched_wheelhouse(requirement_args) if prefetch else None
+    if wheelhouse is not None:
+        find_links.append(wheelhouse)
+        log_event({"event": "prefetched", "wheelhouse": str(wheelhouse)})
+
+    with tempfile.TemporaryDirectory() as downloads:
+        summary = {}
+        if wheelhouse is not None:
+            summary["prefetched_wheelhouse"] = str(wheelhouse)
+        # Requirements are already local if installing from wheels
+        if download and not find_links:
+            summary = _download(requirement_args, Path(downloads))
+            if summary.get("packages"):
+                find_links.append(Path(downloads))
+
+        start = time.time()
+        _install_from(requirement_args, installer, find_links)
+        summary["install_seconds"] = round(time.time() - start, 2)
+    log_event({"event": "installed", "seconds": summary["install_seconds"]})
+    return summary
+
+
+def _download(requirement_args: Sequence[str], path: Path) -> Dict[str, Any]:
+    """Download wheels of `requirement_args` to `path`, returning a summary."""
+    from metaflow_extensions.nesta.pip_download import fetch, UnsupportedDownloadError
+
+    try:
+        return fetch(sys.executable, requirement_args, path)
+    # `ValueError` on hash mismatches
+    except (
+        UnsupportedDownloadError,
+        subprocess.CalledProcessError,
+        OSError,
+        ValueError,
+    ) as e:
+        logging.warning(f"Falling back to pip, can't download requirements: {e}")
+        return {}
+
+
+def _shared_wheelhouse(
+    requirement_args: Sequence[str],
+    flow_path: Path,
+    flow_name: str,
+    step_name: str,
+    storage,
+    path: Path,
+) -> Dict[str, Any]:
+    """Get wheels of the shared environment of `requirement_args` into `path`."""
+    from metaflow_extensions.nesta.env_registry import (
+        build_wheelhouse,
+        environment_spec,
+        EnvironmentRegistry,
+        spec_key,
+    )
+    from metaflow_extensions.nesta.installers import UnsupportedRequirementsError
+    from metaflow_extensions.nesta.pip_download import log_event
+
+    from .preinstall_environment import preinstall_scripts
+
+    try:
+        spec = environment_spec(
+            requirement_args, preinstall_scripts(flow_path, step_name)
+        )
+    except UnsupportedRequirementsError as e:
+        logging.warning(f"Not using a shared environment: {e}")
+        return {}
+
+    start = time.time()
+    key = spec_key(spec)
+    registry = EnvironmentRegistry(storage)
+    reused = registry.has(key)
+    try:
+        if reused:
+            registry.fetch(key, path)
+        else:
+            build_wheelhouse(sys.executable, requirement_args, path)
+            registry.publish(key, spec, path)
+    except (subprocess.CalledProcessError, OSError) as e:
+        logging.warning(f"Not using a shared environment: {e}")
+        return {}
+    registry.use(key, flow_name, step_name)
+    shared = {"shared_environment": key, "reused": reused}
+    log_event({"event": "shared", **shared, "seconds": round(time.time() - start, 2)})
+    return shared
+
+
+def _install_from(
+    requirement_args: Sequence[str], installer: str, find_links: List[Path]
+) -> None:
+    """Install and check `requirement_args` with `installer` from `find_links`."""
+    from metaflow_extensions.nesta.installers import (
+        InconsistentRequirementsError,
+        PipInstaller,
+        UnsupportedRequirementsError,
+        WheelInstaller,
     )
-    _ensure_consistent_pip_deps()
 
+    if installer == "wheel" and find_links:
+        try:
+            wheel_installer = WheelInstaller(find_links)
+            wheel_installer.install(requirement_args)
+            wheel_installer.check()
+        except UnsupportedRequirementsError as e:
+            logging.warning(f"Falling back to pip, can't install from wheels: {e}")
+        except InconsistentRequirementsError as e:
+            # `pip install` repairs the environment, `pip check` verifies it
+            logging.warning(f"Falling back to pip, inconsistent after install: {e}")
+        else:
+            return
+
+    if find_links:
+        try:
+            PipInstaller(sys.executable, find_links).install(requirement_args)
+        except subprocess.CalledProcessError:
+            logging.warning("Failed to install from local wheels, retrying.")
+        else:
+            PipInstaller(sys.executable).check()
+            return
+
+    pip_installer = PipInstaller(sys.executable)
+    pip_installer.install(requirement_args)
+    pip_installer.check()
 
-def _ensure_consistent_pip_deps():
-    from metaflow_extensions.nesta.utils import pip
 
-    pip(sys.executable, "check", capture_output=True)
+def _distributions() -> List[Any]:
+    import importlib
 
+    from metaflow_extensions.nesta.installers import metadata
+    from metaflow_extensions.nesta.utils import site_packages
 
-def pip_install_reqs(path: Path) -> None:
-    """`pip install -r <path>`."""
-    from metaflow_extensions.nesta.utils import pip_install
+    importlib.invalidate_caches()
+    return list(metadata.distributions(path=site_packages(sys.executable)))
 
-    pip_install(sys.executable, ("-r", str(path)))
-    _ensure_consistent_pip_deps()
+
+def _installed_distributions() -> Set[Tuple[str, str]]:
+    """Name and version of the distributions installed for `sys.executable`."""
+    return {(dist.metadata["Name"], dist.version) for dist in _distributions()}
+
+
+def _compile_bytecode(installed: Set[Tuple[str, str]]) -> None:
+    """Byte-compile distributions that weren't `installed` before installing."""
+    from metaflow_extensions.nesta.utils import compile_bytecode, top_level_paths
+
+    # Rather than the whole of site-packages, which is slow even when already
+    # compiled
+    paths = top_level_paths(
+        dist
+        for dist in _distributions()
+        if (dist.metadata["Name"], dist.version) not in installed
+    )
+    if paths:
+        compile_bytecode(sys.executable, *paths)
+
+
+def pip_install_reqs(
+    path: Path,
+    compile_bytecode: bool = True,
+    prefetch: bool = False,
+    installer: str = "pip",
+    wheels: Optional[Path] = None,
+    download: bool = False,
+) -> Dict[str, Any]:
+    """`pip install -r <path>` (or install with `installer`), returning a summary."""
+    installed = _installed_distributions() if compile_bytecode else set()
+    summary = _install(reqs_args(path), prefetch, installer, wheels, download)
+    if compile_bytecode:
+        _compile_bytecode(installed)
+    return summary
@@ -1,6 +1,7 @@
 """Implements a metaflow environment to run preinstall scripts."""
 import sys
 from pathlib import Path
+from typing import List
 
 from metaflow.metaflow_environment import MetaflowEnvironment
 from metaflow.plugins.conda.conda_environment import CondaEnvironment
@@ -64,18 +65,22 @@ class PreinstallEnvironment(MetaflowEnvironment):
         ]
 
         # Run any pre-install scripts
-        flow_name = Path(sys.argv[0]).stem
-        flow_dir = Path(sys.argv[0]).parent
-
-        preinstalls = (
-            "preinstall.sh",
-            f"preinstall-{flow_name}.sh",
-            f"preinstall-{flow_name}-{step_name}.sh",
-        )
-        preinstalls = list(
-            filter(lambda fname: (flow_dir / fname).exists(), preinstalls)
-        )
-        for fname in preinstalls:
-            cmds.extend([f"chmod +x {fname}", f"./{fname}"])
+        for path in preinstall_scripts(Path(sys.argv[0]), step_name):
+            cmds.extend([f"chmod +x {path.name}", f"./{path.name}"])
         print("Bootstrap commands added by preinstall environment:", cmds)
         return cmds
+
+
+def preinstall_scripts(flow_path: Path, step_name: str) -> List[Path]:
+    """Preinstall scripts run (in order) before step `step_name` of `flow_path`."""
+    flow_name = flow_path.stem
+    scripts = (
+        "preinstall.sh",
+        f"preinstall-{flow_name}.sh",
+        f"preinstall-{flow_name}-{step_name}.sh",
+    )
+    return [
+        flow_path.parent / fname
+        for fname in scripts
+        if (flow_path.parent / fname).exists()
+    ]
@@ -0,0 +1,210 @@
+"""Implements a CLI command recommending step resources from past usage.
+
+Usage:
+```
+python flow.py resources advise [--run-id RUN_ID ...] [--max-runs N]
+    [--headroom 1.2] [--json]
+```
+
+Implementation notes:
+- Resource usage is read from the "resource-usage" task metadata stored by
+  `@resource_monitor` through the metadata provider of the command (e.g.
+  `--metadata local`), the latest attempt of each task is used.
+- Usage is aggregated per step across all tasks (e.g. foreach tasks) of all
+  selected runs:
+  - CPU: the 95th percentile (across tasks) of each task's 95th percentile of
+    cores used over a sampling interval
+  - Memory: the peak RSS of any task, as running out of memory is fatal
+  - Disk I/O and network: the largest totals of any task
+- Recommendations multiply observed usage by `--headroom`, CPUs are rounded
+  up to whole cores and memory (in MB, as `@batch`/`@resources`) up to a
+  multiple of 256MB.
+"""
+import json
+import math
+from collections import defaultdict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from metaflow._vendor import click
+
+from metaflow_extensions.nesta.resource_usage import decode, percentile, summarize
+from metaflow_extensions.nesta.utils import graph_step_order, human_bytes
+from .resource_monitor_decorator import METADATA_FIELD
+
+# Decorators whose `cpu` and `memory` attributes set a step's resources
+RESOURCE_DECORATORS = {"batch", "kubernetes", "resources"}
+
+# Granularity (in MB) of memory recommendations
+MEMORY_STEP_MB = 256
+
+
+class StepAdvice(NamedTuple):
+    """Observed resource usage of a step and recommended resources."""
+
+    step_name: str
+    tasks: int
+    cpu_p95: float
+    rss_peak: int
+    read: int
+    write: int
+    rx: int
+    tx: int
+    current_cpu: Optional[float]
+    current_memory: Optional[float]
+    cpu: int
+    memory: int
+
+
+@click.group()
+def cli():  # noqa: D103
+    pass
+
+
+@cli.group(help="Commands related to resource usage.")
+def resources():  # noqa: D103
+    pass
+
+
+@resources.command(help="Recommend step resources from usage in past runs.")
+@click.option(
+    "--run-id",
+    "run_ids",
+    multiple=True,
+    help="Run(s) to aggregate. Defaults to the most recent `--max-runs` runs.",
+)
+@click.option(
+    "--max-runs",
+    default=10,
+    show_default=True,
+    type=int,
+    help="Number of most recent runs to aggregate if no `--run-id` is given.",
+)
+@click.option(
+    "--headroom",
+    default=1.2,
+    show_default=True,
+    type=float,
+    help="Multiplier applied to observed usage.",
+)
+@click.option(
+    "--json", "as_json", is_flag=True, default=False, help="Output JSON lines."
+)
+@click.pass_obj
+def advise(obj, run_ids, max_runs, headroom, as_json):  # noqa: D103
+    flow_name = obj.flow.name
+    if not run_ids:
+        run_ids = list_run_ids(obj.metadata, flow_name)[:max_runs]
+
+    summaries = defaultdict(list)
+    for run_id in run_ids:
+        for step_name, summary in run_summaries(obj.metadata, flow_name, run_id):
+            summaries[step_name].append(summary)
+
+    for step_name in graph_step_order(obj.graph):
+        if step_name not in summaries:
+            continue
+        advice = advise_step(
+            step_name,
+            summaries[step_name],
+            headroom,
+            current_resources(obj.graph[step_name].decorators),
+        )
+        click.echo(json.dumps(advice._asdict()) if as_json else format_advice(advice))
+
+
+def list_run_ids(metadata, flow_name: str) -> List[str]:
+    """Run ids of `flow_name`, most recent first."""
+    runs = metadata.get_object("flow", "run", None, None, flow_name)
+    runs = sorted(runs, key=lambda run: run["ts_epoch"], reverse=True)
+    return [str(run["run_number"]) for run in runs]
+
+
+def run_summaries(
+    metadata, flow_name: str, run_id: str
+) -> Iterator[Tuple[str, Dict[str, float]]]:
+    """Yield step name and usage summary of each monitored task of `run_id`."""
+    for step in metadata.get_object("run", "step", None, None, flow_name, run_id):
+        step_name = step["step_name"]
+        tasks = metadata.get_object(
+            "step", "task", None, None, flow_name, run_id, step_name
+        )
+        for task in tasks:
+            value = task_usage(metadata, flow_name, run_id, step_name, task["task_id"])
+            if value is not None:
+                yield step_name, summarize(decode(value))
+
+
+def task_usage(
+    metadata, flow_name: str, run_id: str, step_name: str, task_id: str
+) -> Optional[str]:
+    """Encoded resource usage of the latest attempt of a task, if any."""
+    data = metadata.get_object(
+        "task", "metadata", None, None, flow_name, run_id, step_name, str(task_id)
+    )
+    usage = [datum for datum in data if datum["field_name"] == METADATA_FIELD]
+    if not usage:
+        return None
+    return max(usage, key=lambda datum: datum["ts_epoch"])["value"]
+
+
+def current_resources(decorators) -> Tuple[Optional[float], Optional[float]]:
+    """CPU and memory (MB) requested for a step by its decorators."""
+    cpu = memory = None
+    for decorator in decorators:
+        if decorator.name not in RESOURCE_DECORATORS:
+            continue
+        # Metaflow uses the largest value of all resource decorators
+        if decorator.attributes.get("cpu") is not None:
+            cpu = max(cpu or 0, float(decorator.attributes["cpu"]))
+        if decorator.attributes.get("memory") is not None:
+            memory = max(memory or 0, float(decorator.attributes["memory"]))
+    return cpu, memory
+
+
+def advise_step(
+    step_name: str,
+    summaries: List[Dict[str, float]],
+    headroom: float,
+    current: Tuple[Optional[float], Optional[float]] = (None, None),
+) -> StepAdvice:
+    """Aggregate `summaries` of a step's tasks into `StepAdvice`."""
+    cpu_p95 = percentile([summary["cpu_p95"] for summary in summaries], 95)
+    rss_peak = max(summary["rss_peak"] for summary in summaries)
+    memory_mb = rss_peak * headroom / 1024**2
+    return StepAdvice(
+        step_name=step_name,
+        tasks=len(summaries),
+        cpu_p95=cpu_p95,
+        rss_peak=rss_peak,
+        read=max(summary["read"] for summary in summaries),
+        write=max(summary["write"] for summary in summaries),
+        rx=max(summary["rx"] for summary in summaries),
+        tx=max(summary["tx"] for summary in summaries),
+        current_cpu=current[0],
+        current_memory=current[1],
+        cpu=max(1, math.ceil(cpu_p95 * headroom)),
+        memory=max(1, math.ceil(memory_mb / MEMORY_STEP_MB)) * MEMORY_STEP_MB,
+    )
+
+
+def format_advice(advice: StepAdvice) -> str:
+    """Human readable, single line representation of `advice`."""
+    line = (
+        f"{advice.step_name} ({advice.tasks} tasks): cpu p95={advice.cpu_p95:.2f}"
+        f" rss peak={human_bytes(advice.rss_peak)}"
+        f" read={human_bytes(advice.read)} write={human_bytes(advice.write)}"
+        f" rx={human_bytes(advice.rx)} tx={human_bytes(advice.tx)}"
+        f" -> cpu={advice.cpu} memory={advice.memory}"
+    )
+    if advice.current_cpu is not None or advice.current_memory is not None:
+        line += (
+            f" (currently cpu={_format_number(advice.current_cpu)}"
+            f" memory={_format_number(advice.current_memory)})"
+        )
+    return line
+
+
+def _format_number(value: Optional[float]) -> str:
+    if value is None:
+        return "?"
+    return f"{value:g}"
@@ -0,0 +1,98 @@
+"""Implements a monitor sidecar sampling resource usage of a task.
+
+Implementation notes:
+- Metaflow starts monitor sidecars with `SidecarSubProcess`, which runs
+  `metaflow/sidecar_worker.py` in a subprocess of the process being
+  monitored. The worker blocks reading messages from stdin so sampling
+  happens in a background thread.
+- The process tree of the parent process (i.e. the task) is sampled every
+  `METAFLOW_RESOURCE_MONITOR_INTERVAL` seconds, excluding the sidecar itself.
+- Samples are appended (one JSON list per line) to a spool file keyed by the
+  parent's pid, which the parent reads back when it finishes (see
+  `ResourceMonitorDecorator`). The first line of the spool is the pid of the
+  sidecar so that the parent can exclude it from its own samples. The spool
+  is deleted when the sidecar shuts down, i.e. when the parent terminates its
+  sidecars or exits.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from metaflow_extensions.nesta.resource_usage import Sample, sample_process_tree
+
+
+class ResourceMonitor(object):
+    """Monitor sidecar sampling CPU, memory, I/O and network usage of a task.
+
+    Select with `--monitor resourceMonitor` to sample every process Metaflow
+    starts, or use `@resource_monitor` to sample (and store) the usage of
+    tasks.
+    """
+
+    TYPE = "resourceMonitor"
+
+    def __init__(self):  # noqa: D107
+        from metaflow_extensions.nesta.config.metaflow_config import (
+            RESOURCE_MONITOR_INTERVAL,
+        )
+
+        self._pid = os.getppid()
+        self._interval = float(RESOURCE_MONITOR_INTERVAL)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def _sample(self) -> None:
+        path = spool_path(self._pid)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        exclude = {os.getpid()}
+        with open(path, "w") as f:
+            f.write(json.dumps(os.getpid()) + "\n")
+            f.flush()
+            while not self._stop.is_set():
+                sample = sample_process_tree(self._pid, exclude)
+                if sample is None:  # Parent exited
+                    return
+                f.write(json.dumps(sample) + "\n")
+                f.flush()
+                self._stop.wait(self._interval)
+
+    def process_message(self, msg) -> None:
+        """Ignore Metaflow's own metrics (counters, timers and gauges)."""
+        pass
+
+    def shutdown(self) -> None:
+        """Stop sampling and remove the spool."""
+        self._stop.set()
+        self._thread.join()
+        try:
+            spool_path(self._pid).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def spool_path(pid: int) -> Path:
+    """Where samples of the process tree of `pid` are spooled."""
+    from metaflow_extensions.nesta.config.metaflow_config import (
+        RESOURCE_MONITOR_PATH,
+    )
+
+    return Path(RESOURCE_MONITOR_PATH) / f"{pid}.jsonl"
+
+
+def read_spool(pid: int) -> Tuple[Optional[int], List[Sample]]:
+    """Pid of the sidecar sampling `pid` and the samples spooled so far."""
+    try:
+        header, *lines = spool_path(pid).read_text().splitlines()
+        sidecar_pid = int(header)
+    except (FileNotFoundError, ValueError):  # Not started yet
+        return None, []
+    samples = []
+    for line in lines:
+        try:
+            samples.append(Sample(*json.loads(line)))
+        except (ValueError, TypeError):  # Partially written line
+            continue
+    return sidecar_pid, samples
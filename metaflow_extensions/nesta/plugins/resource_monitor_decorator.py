@@ -0,0 +1,137 @@
+"""Implements a step decorator storing the resource usage of tasks.
+
+Implementation notes:
+- StepDecorator.task_pre_step starts the `resourceMonitor` sidecar (see
+  `resource_monitor`) which samples the task's process tree in the
+  background. If the sidecar is already running because it was selected as
+  the monitor (`--monitor resourceMonitor`), it is not started again.
+- The decorator itself takes the first and last samples, so short tasks (or
+  tasks starving the sidecar of CPU) still get a baseline and totals.
+- StepDecorator.task_finished reads the samples back, stops the sidecar, and
+  registers the (compactly encoded, see `resource_usage`) samples as task
+  metadata named "resource-usage". Samples are stored whether or not the task
+  succeeded - failed tasks (e.g. out of memory) are the most informative.
+- Sampling reads `/proc`, on other platforms (e.g. macOS) the decorator
+  warns and does nothing.
+- `python flow.py resources advise` aggregates the stored samples into
+  recommendations (see `resource_advisor_cli`).
+"""
+import logging
+import os
+import sys
+
+from metaflow.decorators import StepDecorator
+
+# Name and type of the task metadata samples are stored in
+METADATA_FIELD = "resource-usage"
+
+
+class ResourceMonitorDecorator(StepDecorator):
+    """Step decorator to sample and store the resource usage of a step's tasks.
+
+    To use, add this decorator to your step:
+    ```python
+    @resource_monitor
+    @step
+    def MyStep(self):
+        ...
+    ```
+    or monitor every step with `python flow.py run --with resource_monitor`.
+
+    CPU, memory (RSS), disk I/O and network usage of the task's process tree
+    is sampled every `METAFLOW_RESOURCE_MONITOR_INTERVAL` seconds (default: 1)
+    and stored as task metadata. Use `python flow.py resources advise` to get
+    recommended `@batch`/`@resources` settings from past runs.
+    """
+
+    name = "resource_monitor"
+
+    defaults = {}
+
+    # Set by `task_pre_step`, which may not run (e.g. an earlier decorator's
+    # `task_pre_step` raised) before `task_finished` is called
+    _task = None
+
+    def task_pre_step(
+        self,
+        step_name,
+        task_datastore,
+        metadata,
+        run_id,
+        task_id,
+        flow,
+        graph,
+        retry_count,
+        max_user_code_retries,
+        ubf_context,
+        inputs,
+    ):
+        """Start sampling resource usage."""
+        from metaflow.sidecar import SidecarSubProcess
+        from metaflow_extensions.nesta.resource_usage import (
+            is_supported,
+            sample_process_tree,
+        )
+
+        from .resource_monitor import ResourceMonitor
+
+        if not is_supported():
+            logging.warning(
+                f"Not monitoring resource usage, unsupported platform: {sys.platform}"
+            )
+            return
+        self._metadata = metadata
+        self._task = (run_id, step_name, task_id)
+        self._first_sample = sample_process_tree(os.getpid())
+        self._sidecar = (
+            None
+            if _monitor_type(sys.argv) == ResourceMonitor.TYPE
+            else SidecarSubProcess(ResourceMonitor.TYPE)
+        )
+
+    def task_finished(
+        self, step_name, flow, graph, is_task_ok, retry_count, max_user_code_retries
+    ):
+        """Stop sampling and store samples as task metadata."""
+        from metaflow.metadata import MetaDatum
+        from metaflow_extensions.nesta.config.metaflow_config import (
+            RESOURCE_MONITOR_MAX_SAMPLES,
+        )
+        from metaflow_extensions.nesta.resource_usage import (
+            downsample,
+            encode,
+            sample_process_tree,
+        )
+
+        from .resource_monitor import read_spool
+
+        if self._task is None:
+            return
+        sidecar_pid, samples = read_spool(os.getpid())
+        last_sample = sample_process_tree(os.getpid(), exclude={sidecar_pid})
+        if self._sidecar is not None:
+            self._sidecar.kill()
+
+        samples = [self._first_sample, *samples, last_sample]
+        samples = downsample(samples, int(RESOURCE_MONITOR_MAX_SAMPLES))
+        self._metadata.register_metadata(
+            *self._task,
+            [
+                MetaDatum(
+                    field=METADATA_FIELD,
+                    value=encode(samples),
+                    type=METADATA_FIELD,
+                    tags=[f"attempt_id:{retry_count}"],
+                )
+            ],
+        )
+
+
+def _monitor_type(argv) -> str:
+    """Value of the `--monitor` option in `argv`, if any."""
+    for i, arg in enumerate(argv):
+        if arg == "--monitor" and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith("--monitor="):
+            return arg.split("=", 1)[1]
+    return ""
@@ -0,0 +1,242 @@
+"""Sampling, compact encoding and summaries of task resource usage.
+
+Samples are read from `/proc` (Linux only) for a root process and all of its
+descendants. Each `Sample` holds:
+- `t`: Epoch time of the sample (seconds)
+- `cpu`: CPU time (user + system, seconds) of the process tree, including
+  reaped children, i.e. it is cumulative
+- `rss`: Resident set size of the process tree (bytes)
+- `peak`: Sum of the peak resident set sizes of the processes of the tree
+  (bytes), i.e. an upper bound of the tree's peak RSS that captures peaks
+  between samples
+- `read`/`write`: Cumulative bytes read from/written to storage by the
+  process tree, including reaped children
+- `rx`/`tx`: Cumulative bytes received/sent by the network namespace of the
+  root process (excluding loopback). Namespaces are not per-process so this
+  includes traffic of other processes sharing the namespace, e.g. other
+  tasks running on the same machine without a container.
+
+Samples are stored as task metadata in a compact form: each column is scaled
+to integers (centiseconds, KiB) and delta-encoded, then the JSON is
+zlib-compressed and base64-encoded. An hour of samples at one second
+intervals takes a few KiB.
+"""
+import base64
+import json
+import math
+import os
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set
+
+# Version of the encoding
+ENCODING_VERSION = 1
+
+
+class Sample(NamedTuple):
+    """Resource usage of a process tree at time `t`."""
+
+    t: float
+    cpu: float
+    rss: int
+    peak: int
+    read: int
+    write: int
+    rx: int
+    tx: int
+
+
+# Multipliers turning each field of `Sample` into integers for encoding
+_SCALES = (100, 100) + (1 / 1024,) * 6
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def is_supported() -> bool:
+    """Whether resource usage can be sampled on this platform (`/proc` exists)."""
+    return os.path.isdir("/proc")
+
+
+def sample_process_tree(
+    pid: int, exclude: Optional[Set[int]] = None, t: Optional[float] = None
+) -> Optional[Sample]:
+    """Resource usage of `pid` and its descendants, `None` if `pid` has exited."""
+    import time
+
+    # `exclude` (e.g. the sampler itself) and its descendants are not counted
+    if not is_supported():
+        return None
+    t = time.time() if t is None else t
+    stats = _proc_stats()
+    if pid not in stats:
+        return None
+
+    children: Dict[int, List[int]] = {}
+    for child, (ppid, *_) in stats.items():
+        children.setdefault(ppid, []).append(child)
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        if exclude and current in exclude:
+            continue
+        tree.append(current)
+        stack.extend(children.get(current, []))
+
+    cpu_ticks = rss_pages = peak = read = write = 0
+    for member in tree:
+        _, ticks, pages = stats[member]
+        cpu_ticks += ticks
+        rss_pages += pages
+        peak += _proc_peak_rss(member)
+        member_read, member_write = _proc_io(member)
+        read += member_read
+        write += member_write
+    rss = rss_pages * _PAGE_SIZE
+    rx, tx = _proc_net(pid)
+    return Sample(t, cpu_ticks / _CLOCK_TICKS, rss, max(rss, peak), read, write, rx, tx)
+
+
+def _proc_stats() -> Dict[int, tuple]:
+    """Map of pid to (parent pid, CPU ticks incl. reaped children, RSS pages)."""
+    stats = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                # The command name (2nd field) may contain spaces, skip past it
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:  # Process exited
+            continue
+        # Fields are numbered from 3 (state), see `man 5 proc`
+        ticks = sum(int(field) for field in fields[11:15])  # (c)utime, (c)stime
+        stats[int(entry.name)] = (int(fields[1]), ticks, int(fields[21]))
+    return stats
+
+
+def _proc_peak_rss(pid: int) -> int:
+    """Peak resident set size of `pid` in bytes, zero if not readable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024  # kB
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _proc_io(pid: int) -> tuple:
+    """(read bytes, write bytes) of `pid`, zeros if not readable."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            io = dict(line.split(": ") for line in f.read().splitlines())
+    except (OSError, ValueError):
+        return 0, 0
+    return int(io.get("read_bytes", 0)), int(io.get("write_bytes", 0))
+
+
+def _proc_net(pid: int) -> tuple:
+    """(received bytes, sent bytes) of the network namespace of `pid`."""
+    rx = tx = 0
+    try:
+        with open(f"/proc/{pid}/net/dev") as f:
+            lines = f.read().splitlines()[2:]  # Skip headers
+    except OSError:
+        return rx, tx
+    for line in lines:
+        interface, counters = line.split(":", 1)
+        if interface.strip() == "lo":
+            continue
+        counters = counters.split()
+        rx += int(counters[0])
+        tx += int(counters[8])
+    return rx, tx
+
+
+def encode(samples: Sequence[Sample]) -> str:
+    """Compact, ASCII representation of `samples`."""
+    columns = []
+    for i, scale in enumerate(_SCALES):
+        values = [round(sample[i] * scale) for sample in samples]
+        columns.append(values[:1] + [b - a for a, b in _pairwise(values)])
+    payload = json.dumps(
+        {"v": ENCODING_VERSION, "fields": Sample._fields, "columns": columns},
+        separators=(",", ":"),
+    )
+    return base64.b64encode(zlib.compress(payload.encode(), 9)).decode()
+
+
+def decode(value: str) -> List[Sample]:
+    """Inverse of `encode`."""
+    payload = json.loads(zlib.decompress(base64.b64decode(value)))
+    if payload["v"] != ENCODING_VERSION:
+        raise ValueError(f"Unknown resource usage encoding: {payload['v']}")
+    columns = []
+    for i, deltas in enumerate(payload["columns"]):
+        total, values = 0, []
+        for delta in deltas:
+            total += delta
+            values.append(total / _SCALES[i])
+        columns.append(values)
+    return [
+        Sample(row[0], row[1], *(int(value) for value in row[2:]))
+        for row in _transpose(columns)
+    ]
+
+
+def downsample(samples: Sequence[Sample], max_samples: int) -> List[Sample]:
+    """Keep at most `max_samples`, with the peak memory of dropped windows."""
+    if len(samples) <= max_samples:
+        return list(samples)
+    # The first sample is kept as the baseline of cumulative counters
+    stride = math.ceil((len(samples) - 1) / (max_samples - 1))
+    out = [samples[0]]
+    for start in range(1, len(samples), stride):
+        window = samples[start : start + stride]
+        # Cumulative counters are taken at the end of the window
+        out.append(
+            window[-1]._replace(
+                rss=max(sample.rss for sample in window),
+                peak=max(sample.peak for sample in window),
+            )
+        )
+    return out
+
+
+def summarize(samples: Sequence[Sample]) -> Dict[str, float]:
+    """Summary statistics of `samples`."""
+    first, last = samples[0], samples[-1]
+    duration = last.t - first.t
+    # CPU cores used over each sampling interval
+    cores = [
+        max(0.0, b.cpu - a.cpu) / (b.t - a.t)
+        for a, b in _pairwise(samples)
+        if b.t > a.t
+    ]
+    return {
+        "duration": duration,
+        "cpu_mean": (last.cpu - first.cpu) / duration if duration > 0 else 0.0,
+        "cpu_p95": percentile(cores, 95) if cores else 0.0,
+        "cpu_max": max(cores, default=0.0),
+        "rss_peak": max(sample.peak for sample in samples),
+        "read": max(0, last.read - first.read),
+        "write": max(0, last.write - first.write),
+        "rx": max(0, last.rx - first.rx),
+        "tx": max(0, last.tx - first.tx),
+    }
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank `q`th percentile of `values`."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _pairwise(values: Sequence) -> List[tuple]:
+    return [(values[i - 1], values[i]) for i in range(1, len(values))]
+
+
+def _transpose(columns: List[List[float]]) -> List[tuple]:
+    return [tuple(column[i] for column in columns) for i in range(len(columns[0]))]
@@ -1,3 +1,6 @@
+from ..host_cache import host_cache  # noqa: F401
+from ..mmap_artifact import MmapArtifact  # noqa: F401
+
 __mf_extensions__ = "nesta"
 
 __version__ = None
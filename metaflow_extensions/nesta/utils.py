@@ -4,7 +4,7 @@ import os
 import shlex
 import subprocess
 from contextlib import contextmanager
-from typing import Tuple, Union
+from typing import Iterable, List, Optional, Tuple, Union
 
 
 @contextmanager
@@ -28,6 +28,49 @@ def is_mflow_conda_environment(argv, default_env) -> bool:
     )
 
 
+def graph_step_order(graph) -> List[str]:
+    """Step names of a `FlowGraph` in breadth-first order from `start`."""
+    order, queue = [], ["start"]
+    while queue:
+        step_name = queue.pop(0)
+        if step_name in order or step_name not in graph:
+            continue
+        order.append(step_name)
+        queue.extend(graph[step_name].out_funcs)
+    return order
+
+
+def human_bytes(size: Optional[float]) -> str:
+    """Human readable `size` (in bytes), "?" if unknown."""
+    if size is None:
+        return "?"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def delete_paths(storage, paths: List[str]) -> None:
+    """Delete `paths` from `storage` (local and S3 datastores only)."""
+    from urllib.parse import urlparse
+
+    for path in paths:
+        uri = storage.full_uri(path)
+        if storage.TYPE == "local":
+            try:
+                os.remove(uri)
+            except FileNotFoundError:
+                pass
+        elif storage.TYPE == "s3":
+            url = urlparse(uri)
+            storage.s3_client.client.delete_object(
+                Bucket=url.netloc, Key=url.path.lstrip("/")
+            )
+        else:
+            logging.warning(f"Can't delete {uri} from a {storage.TYPE} datastore.")
+
+
 def pip(
     executable: str, *pip_cmds: str, **subprocess_kwargs
 ) -> subprocess.CompletedProcess:
@@ -55,3 +98,46 @@ def pip_install(
         *map(shlex.quote, args),
         stdout=subprocess.DEVNULL,
     )
+
+
+def site_packages(executable: str) -> List[str]:
+    """Site-packages directories of the given python executable."""
+    process = subprocess.run(
+        [
+            executable,
+            "-c",
+            "import sysconfig; paths = sysconfig.get_paths();"
+            " print(paths['purelib']); print(paths['platlib'])",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return sorted(set(filter(os.path.isdir, process.stdout.splitlines())))
+
+
+def top_level_paths(dists: Iterable) -> List[str]:
+    """Top-level packages and modules containing the Python files of `dists`."""
+    paths = set()
+    for dist in dists:
+        for file in dist.files or []:
+            # Files installed outside site-packages (e.g. scripts) start with ".."
+            if file.suffix == ".py" and file.parts[0] != "..":
+                paths.add(str(dist.locate_file(file.parts[0])))
+    return sorted(paths)
+
+
+def compile_bytecode(executable: str, *paths: str) -> subprocess.CompletedProcess:
+    """Byte-compile `paths` in parallel across cores for the given executable."""
+    logging.info(f"Compiling bytecode in {paths} for {executable}.")
+    # Up-to-date `.pyc` files are skipped so re-compiling is cheap.
+    process = subprocess.run(
+        [executable, "-m", "compileall", "-q", "-j", "0", *paths],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    # Failures (e.g. Python 2 only files shipped by some packages) don't stop
+    # other modules being imported so are logged rather than raised
+    if process.returncode != 0:
+        logging.warning(f"Some files failed to compile:\n{process.stdout}")
+    return process
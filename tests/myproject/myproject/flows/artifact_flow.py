@@ -0,0 +1,56 @@
+from metaflow import FlowSpec, step
+
+
+class MetaflowExtensionsArtifactFlow(FlowSpec):
+    """Flow for testing the `artifacts report` command."""
+
+    @step
+    def start(self):
+        """Create a large artifact and fan out."""
+        self.big = bytes(1024 * 1024)
+        self.items = [1, 2]
+        self.next(self.fan, foreach="items")
+
+    @step
+    def fan(self):
+        """Pass `big` through unchanged and add a per-task artifact."""
+        self.small = self.input
+        self.next(self.join)
+
+    @step
+    def join(self, inputs):
+        """Join the chunks."""
+        self.merge_artifacts(inputs, include=["big"])
+        self.next(self.split)
+
+    @step
+    def split(self):
+        """Split into parallel branches."""
+        self.next(self.left, self.right)
+
+    @step
+    def left(self):
+        """Compute the same value as the parallel branch."""
+        self.same = bytes(1024)
+        self.next(self.merge)
+
+    @step
+    def right(self):
+        """Compute the same value as the parallel branch."""
+        self.same = bytes(1024)
+        self.next(self.merge)
+
+    @step
+    def merge(self, inputs):
+        """Join the branches."""
+        self.merge_artifacts(inputs)
+        self.next(self.end)
+
+    @step
+    def end(self):
+        """Done."""
+        pass
+
+
+if __name__ == "__main__":
+    MetaflowExtensionsArtifactFlow()
@@ -0,0 +1,35 @@
+from metaflow import checkpoint, current, FlowSpec, retry, step
+
+
+class MetaflowExtensionsCheckpointFlow(FlowSpec):
+    """Flow for testing `@checkpoint`."""
+
+    @step
+    def start(self):
+        """Start."""
+        self.next(self.train)
+
+    @retry(times=1, minutes_between_retries=0)
+    @checkpoint
+    @step
+    def train(self):
+        """Fail half way through the first attempt, resuming on the retry."""
+        state = current.checkpoint.load(default={"i": 0, "attempts": []})
+        state["attempts"].append(current.retry_count)
+        for i in range(state["i"], 10):
+            state["i"] = i + 1
+            current.checkpoint.save(state)
+            if i == 4 and current.retry_count == 0:
+                raise Exception("Simulated failure")
+        assert current.checkpoint.restored == (current.retry_count > 0)
+        self.state = state
+        self.next(self.end)
+
+    @step
+    def end(self):
+        """Check the retry resumed from the checkpoint."""
+        assert self.state == {"i": 10, "attempts": [0, 1]}, self.state
+
+
+if __name__ == "__main__":
+    MetaflowExtensionsCheckpointFlow()
@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from metaflow import FlowSpec, host_cache, step
+
+
+class MetaflowExtensionsHostCacheFlow(FlowSpec):
+    """Flow for testing `host_cache`."""
+
+    @step
+    def start(self):
+        """Fan out to tasks sharing an input."""
+        self.uri = Path(__file__).resolve().as_uri()
+        self.items = list(range(4))
+        self.next(self.fan, foreach="items")
+
+    @step
+    def fan(self):
+        """Read the shared input from the host's cache."""
+        with host_cache(self.uri) as path:
+            self.size = len(path.read_bytes())
+        self.next(self.join)
+
+    @step
+    def join(self, inputs):
+        """Check every task read the same input."""
+        assert len({input.size for input in inputs}) == 1
+        self.next(self.end)
+
+    @step
+    def end(self):
+        """Done."""
+        pass
+
+
+if __name__ == "__main__":
+    MetaflowExtensionsHostCacheFlow()
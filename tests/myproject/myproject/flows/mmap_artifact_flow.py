@@ -0,0 +1,55 @@
+import pickle
+
+from metaflow import FlowSpec, MmapArtifact, step
+
+
+class Blob(object):
+    """Minimal object supporting pickle protocol 5 out-of-band buffers."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        if protocol >= 5:
+            return (Blob, (pickle.PickleBuffer(self.data),))
+        return (Blob, (bytes(self.data),))
+
+
+class MetaflowExtensionsMmapArtifactFlow(FlowSpec):
+    """Flow for testing `MmapArtifact`."""
+
+    @step
+    def start(self):
+        """Store a large blob out-of-band."""
+        self.blob = MmapArtifact(Blob(bytearray(b"x" * 1024 * 1024)))
+        self.items = [1, 2]
+        self.next(self.fan, foreach="items")
+
+    @step
+    def fan(self):
+        """Show the blob is a read-only memory-map and pass it through."""
+        data = self.blob.value.data
+        assert isinstance(data, memoryview), type(data)
+        assert data.readonly
+        assert data.nbytes == 1024 * 1024
+        assert bytes(data[:3]) == b"xxx"
+        self.next(self.join)
+
+    @step
+    def join(self, inputs):
+        """Join the chunks."""
+        self.merge_artifacts(inputs, include=["blob"])
+        # Reassigning the value of a loaded artifact stores the new value
+        self.updated = inputs[0].blob
+        self.updated.value = Blob(bytearray(b"y" * 1024))
+        self.next(self.end)
+
+    @step
+    def end(self):
+        """Done."""
+        assert bytes(self.blob.value.data[-3:]) == b"xxx"
+        assert bytes(self.updated.value.data) == b"y" * 1024
+
+
+if __name__ == "__main__":
+    MetaflowExtensionsMmapArtifactFlow()
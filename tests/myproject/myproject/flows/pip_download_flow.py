@@ -0,0 +1,29 @@
+from metaflow import FlowSpec, pip, step
+
+
+class MetaflowExtensionsPipDownloadFlow(FlowSpec):
+    """Flow for testing parallel download of `@pip` requirements."""
+
+    @step
+    def start(self):
+        """Start flow."""
+        self.next(self.pip)
+
+    @pip(path="requirements.txt", download=True)
+    @step
+    def pip(self):
+        """Installs requirements from downloaded wheels."""
+        import tqdm
+
+        assert tqdm.__version__ == "4.61.0", tqdm.__version__
+
+        self.next(self.end)
+
+    @step
+    def end(self):
+        """End flow."""
+        pass
+
+
+if __name__ == "__main__":
+    MetaflowExtensionsPipDownloadFlow()
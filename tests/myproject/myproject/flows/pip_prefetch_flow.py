@@ -0,0 +1,29 @@
+from metaflow import FlowSpec, pip, step
+
+
+class MetaflowExtensionsPipPrefetchFlow(FlowSpec):
+    """Flow for testing prefetching of `@pip` requirements."""
+
+    @step
+    def start(self):
+        """Prefetches requirements of `pip` in the background."""
+        self.next(self.pip)
+
+    @pip(path="requirements.txt")
+    @step
+    def pip(self):
+        """Installs requirements from prefetched wheels."""
+        import tqdm
+
+        assert tqdm.__version__ == "4.61.0", tqdm.__version__
+
+        self.next(self.end)
+
+    @step
+    def end(self):
+        """End flow."""
+        pass
+
+
+if __name__ == "__main__":
+    MetaflowExtensionsPipPrefetchFlow()
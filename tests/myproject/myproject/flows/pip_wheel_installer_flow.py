@@ -0,0 +1,24 @@
+from metaflow import FlowSpec, pip, step
+
+
+class MetaflowExtensionsPipWheelInstallerFlow(FlowSpec):
+    """Flow for testing the in-process wheel installer of `@pip`."""
+
+    @pip(libraries={"tqdm": "4.61.0"}, installer="wheel", wheels="wheels")
+    @step
+    def start(self):
+        """Installs requirements from local wheels."""
+        import tqdm
+
+        assert tqdm.__version__ == "4.61.0", tqdm.__version__
+
+        self.next(self.end)
+
+    @step
+    def end(self):
+        """End flow."""
+        pass
+
+
+if __name__ == "__main__":
+    MetaflowExtensionsPipWheelInstallerFlow()
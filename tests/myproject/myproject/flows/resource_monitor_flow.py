@@ -0,0 +1,39 @@
+from metaflow import FlowSpec, resource_monitor, resources, step
+
+
+class MetaflowExtensionsResourceMonitorFlow(FlowSpec):
+    """Flow for testing `@resource_monitor` and the `resources advise` command."""
+
+    @step
+    def start(self):
+        """Fan out."""
+        self.sizes = [64, 128]
+        self.next(self.fan, foreach="sizes")
+
+    @resource_monitor
+    @resources(cpu=8, memory=16000)
+    @step
+    def fan(self):
+        """Hold `self.input` MB in memory while burning CPU."""
+        import time
+
+        data = bytearray(self.input * 1024 * 1024)
+        start = time.time()
+        while time.time() - start < 2:
+            sum(range(10_000))
+        del data
+        self.next(self.join)
+
+    @step
+    def join(self, inputs):
+        """Join."""
+        self.next(self.end)
+
+    @step
+    def end(self):
+        """Done."""
+        pass
+
+
+if __name__ == "__main__":
+    MetaflowExtensionsResourceMonitorFlow()
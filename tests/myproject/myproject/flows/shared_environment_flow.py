@@ -0,0 +1,34 @@
+from metaflow import FlowSpec, pip, step
+
+
+class MetaflowExtensionsSharedEnvironmentFlow(FlowSpec):
+    """Flow for testing `@pip` environments shared across flows."""
+
+    @pip(path="requirements.txt", shared=True)
+    @step
+    def start(self):
+        """Builds and publishes the environment."""
+        import tqdm
+
+        assert tqdm.__version__ == "4.61.0", tqdm.__version__
+
+        self.next(self.reuse)
+
+    @pip(path="requirements.txt", shared=True)
+    @step
+    def reuse(self):
+        """Installs from the published environment."""
+        import tqdm
+
+        assert tqdm.__version__ == "4.61.0", tqdm.__version__
+
+        self.next(self.end)
+
+    @step
+    def end(self):
+        """End flow."""
+        pass
+
+
+if __name__ == "__main__":
+    MetaflowExtensionsSharedEnvironmentFlow()
@@ -0,0 +1,45 @@
+"""Tests the `artifacts report` CLI command."""
+
+import json
+
+from metaflow_extensions.nesta.utils import ch_dir
+from utils import run_flow, run_flow_cli  # noqa: I
+
+flow_name = "{}/myproject/myproject/flows/{}.py".format
+
+
+def test_report(temporary_project):
+    path = flow_name(temporary_project, "artifact_flow")
+    with ch_dir(temporary_project / "myproject"):
+        run_flow(path)
+        out = run_flow_cli(path, "artifacts", "report", "--json")
+
+    rows = [json.loads(line) for line in out.stdout.decode().splitlines()]
+    by_step = {}
+    for row in rows:
+        by_step.setdefault((row["step_name"], row["name"]), []).append(row)
+
+    (start_big,) = by_step[("start", "big")]
+    assert start_big["size"] > 1024 * 1024
+    assert start_big["transfer_size"] < start_big["size"]  # gzipped zeros
+    assert start_big["unpickle_seconds"] is not None
+    assert start_big["copy_of"] is None
+
+    fan_big = by_step[("fan", "big")]
+    assert len(fan_big) == 2
+    assert {row["foreach_index"] for row in fan_big} == {"0", "1"}
+    assert all(row["copy_of"].endswith("/start/1") for row in fan_big)
+
+    fan_small = by_step[("fan", "small")]
+    assert all(row["copy_of"] is None for row in fan_small)
+
+    (end_big,) = by_step[("end", "big")]
+    assert end_big["copy_of"] is not None
+
+    # Parallel branches computing the same value are not copies of each other
+    (left_same,) = by_step[("left", "same")]
+    (right_same,) = by_step[("right", "same")]
+    assert left_same["copy_of"] is None
+    assert right_same["copy_of"] is None
+    (merge_same,) = by_step[("merge", "same")]
+    assert merge_same["copy_of"] is not None
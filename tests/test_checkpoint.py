@@ -0,0 +1,41 @@
+"""Tests `@checkpoint`."""
+from pathlib import Path
+
+from metaflow_extensions.nesta.plugins.checkpoint_decorator import Checkpoint
+from metaflow_extensions.nesta.utils import ch_dir
+from utils import run_flow  # noqa: I
+
+flow_name = "{}/myproject/myproject/flows/{}.py".format
+
+
+def test_runs_local(temporary_project):
+    path = flow_name(temporary_project, "checkpoint_flow")
+    with ch_dir(temporary_project / "myproject"):
+        run_flow(path)
+
+    # Checkpoints are deleted once the task succeeds
+    datastore = Path(temporary_project) / "myproject" / ".metaflow"
+    (checkpoints,) = datastore.glob(
+        "MetaflowExtensionsCheckpointFlow/*/train/*/_checkpoints"
+    )
+    assert not list(checkpoints.iterdir())
+
+
+def test_restore_invalid(tmp_path):
+    from metaflow.datastore.local_storage import LocalStorage
+
+    storage = LocalStorage(str(tmp_path))
+    Checkpoint(storage, "checkpoints", 0).save({"epoch": 1})
+    checkpoint = Checkpoint(storage, "checkpoints", 1)
+    assert checkpoint.restore()
+    assert checkpoint.load() == {"epoch": 1}
+
+    # e.g. a task dying while writing
+    (pkl,) = (tmp_path / "checkpoints").glob("*.pkl")
+    pkl.write_bytes(pkl.read_bytes()[:5])
+    checkpoint = Checkpoint(storage, "checkpoints", 1)
+    assert not checkpoint.restore()
+    assert checkpoint.load(default={"epoch": 0}) == {"epoch": 0}
+
+    (tmp_path / "checkpoints" / "latest.json").write_text('{"name": "0-')
+    assert not Checkpoint(storage, "checkpoints", 1).restore()
@@ -0,0 +1,146 @@
+"""Tests the registry of shared `@pip` environments."""
+import json
+import time
+from io import BytesIO
+
+import pytest
+from metaflow.datastore.local_storage import LocalStorage
+
+from metaflow_extensions.nesta.env_registry import (
+    environment_spec,
+    EnvironmentRegistry,
+    spec_key,
+)
+from metaflow_extensions.nesta.installers import UnsupportedRequirementsError
+from metaflow_extensions.nesta.utils import ch_dir, delete_paths
+from utils import make_wheel, run_flow, run_flow_cli  # noqa: I
+
+flow_name = "{}/myproject/myproject/flows/{}.py".format
+
+DAY = 24 * 60 * 60
+
+
+def env_time(registry):
+    """Time the only environment of `registry` was last used."""
+    (env,) = registry.environments()
+    return env.last_used
+
+
+def test_environment_spec(tmp_path):
+    reqs = tmp_path / "requirements.txt"
+    reqs.write_text("# Comment\nTQDM<5,>=4.0\nrequests[socks,security]\n")
+    key = spec_key(environment_spec(["-r", str(reqs)]))
+
+    same = ["requests[security,socks]", "tqdm>=4.0,<5"]
+    assert spec_key(environment_spec(same)) == key
+    assert spec_key(environment_spec(["tqdm>=4.0,<5"])) != key
+
+    preinstall = tmp_path / "preinstall.sh"
+    preinstall.write_text("apt-get install -y libpq-dev\n")
+    assert spec_key(environment_spec(same, [preinstall])) != key
+
+    with pytest.raises(UnsupportedRequirementsError):
+        environment_spec(["-e", "."])
+
+
+def test_registry(tmp_path):
+    registry = EnvironmentRegistry(LocalStorage(str(tmp_path / "datastore")))
+    wheelhouse = tmp_path / "wheelhouse"
+    wheelhouse.mkdir()
+    make_wheel(wheelhouse, "alpha", "1.0")
+    spec = environment_spec(["alpha==1.0"])
+    key = spec_key(spec)
+
+    assert not registry.has(key)
+    registry.use(key, "FlowA", "start")
+    registry.publish(key, spec, wheelhouse)
+    registry.use(key, "FlowB", "train")
+    assert registry.has(key)
+    # e.g. built concurrently
+    assert not registry.publish(key, spec, wheelhouse)
+
+    fetched = tmp_path / "fetched"
+    fetched.mkdir()
+    (wheel,) = registry.fetch(key, fetched)
+    assert wheel.read_bytes() == (wheelhouse / wheel.name).read_bytes()
+
+    (env,) = registry.environments()
+    assert env.spec == spec
+    assert env.size == wheel.stat().st_size
+    assert set(env.users) == {"FlowA/start", "FlowB/train"}
+
+    # Switching environment releases the reference to the previous one
+    registry.use("other", "FlowB", "train")
+    (env,) = registry.environments()
+    assert set(env.users) == {"FlowA/start"}
+
+
+def test_registry_gc(tmp_path):
+    registry = EnvironmentRegistry(LocalStorage(str(tmp_path / "datastore")))
+    wheelhouse = tmp_path / "wheelhouse"
+    wheelhouse.mkdir()
+    make_wheel(wheelhouse, "alpha", "1.0")
+    spec = environment_spec(["alpha==1.0"])
+    key = spec_key(spec)
+    registry.publish(key, spec, wheelhouse)
+    registry.use(key, "FlowA", "start")
+
+    # Referenced and recently used
+    assert registry.gc(DAY) == ([], [], [])
+    # Not used for a while: the reference is stale
+    users, envs, _ = registry.gc(DAY, now=env_time(registry) + 2 * DAY, dry_run=True)
+    assert users == ["FlowA/start"]
+    assert [env.key for env in envs] == [key]
+    assert registry.has(key)
+
+    registry.gc(DAY, now=env_time(registry) + 2 * DAY)
+    assert not registry.has(key)
+    assert registry.users() == {}
+    assert registry.environments() == []
+
+
+def test_registry_gc_orphaned(tmp_path):
+    storage = LocalStorage(str(tmp_path / "datastore"))
+    registry = EnvironmentRegistry(storage)
+    wheelhouse = tmp_path / "wheelhouse"
+    wheelhouse.mkdir()
+    make_wheel(wheelhouse, "alpha", "1.0")
+    spec = environment_spec(["alpha==1.0"])
+    key = spec_key(spec)
+    registry.publish(key, spec, wheelhouse)
+    # A step that died mid-publish
+    registry.publish("partial", spec, wheelhouse)
+    delete_paths(storage, [registry._spec_path("partial")])
+    # A step that lost a concurrent publish
+    lost = registry._path(key, "lost")
+    storage.save_bytes(
+        [(f"{lost}/alpha.whl", (BytesIO(b""), {"created": time.time()}))]
+    )
+
+    _, _, builds = registry.gc(DAY)
+    assert builds == []
+    _, _, builds = registry.gc(DAY, now=time.time() + 2 * DAY)
+    assert len(builds) == 2
+    assert lost in builds
+    assert not list((tmp_path / "datastore").glob("_environments/*/*/*.whl"))
+
+
+def test_runs_local(temporary_project):
+    path = flow_name(temporary_project, "shared_environment_flow")
+    with ch_dir(temporary_project / "myproject"):
+        out = run_flow(path).stdout.decode()
+        (env,) = [
+            json.loads(line)
+            for line in run_flow_cli(path, "environments", "list", "--json")
+            .stdout.decode()
+            .splitlines()
+        ]
+        gc = run_flow_cli(path, "environments", "gc", "--max-age", "0")
+        after = run_flow_cli(path, "environments", "list", "--json")
+
+    assert '"reused": false' in out
+    assert '"reused": true' in out
+    assert env["refs"] == 2
+    assert env["spec"]["requirements"] == ["tqdm==4.61.0"]
+    assert "Removed 2 users and 1 environments" in gc.stdout.decode()
+    assert not after.stdout.decode().strip()
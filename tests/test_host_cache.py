@@ -0,0 +1,97 @@
+"""Tests `host_cache`."""
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from metaflow_extensions.nesta import host_cache as host_cache_module
+from metaflow_extensions.nesta.host_cache import host_cache
+from metaflow_extensions.nesta.utils import ch_dir
+from utils import run_flow  # noqa: I
+
+flow_name = "{}/myproject/myproject/flows/{}.py".format
+
+
+@pytest.fixture
+def downloads(tmp_path, monkeypatch):
+    """Log of (slow) downloads, shared with forked processes."""
+    log = tmp_path / "downloads.log"
+    log.touch()
+    download = host_cache_module._download
+
+    def slow_download(uri, path):
+        with open(log, "a") as f:
+            f.write(uri + "\n")
+        time.sleep(0.5)
+        download(uri, path)
+
+    monkeypatch.setattr(host_cache_module, "_download", slow_download)
+    return log
+
+
+def _file(tmp_path: Path, name: str, size: int) -> str:
+    path = tmp_path / "remote" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(os.urandom(size))
+    return path.as_uri()
+
+
+def _read(uri: str, cache_path: str) -> bytes:
+    with host_cache(uri, cache_path) as path:
+        return path.read_bytes()
+
+
+def test_host_cache(tmp_path, downloads):
+    uri = _file(tmp_path, "table.csv", 100)
+    cache = tmp_path / "cache"
+    with host_cache(uri, cache) as path:
+        assert path.name == "table.csv"
+        assert path.read_bytes() == (tmp_path / "remote" / "table.csv").read_bytes()
+    with host_cache(uri, cache) as path_again:
+        assert path_again == path
+    assert len(downloads.read_text().splitlines()) == 1
+
+
+def test_host_cache_quoted(tmp_path, downloads):
+    uri = _file(tmp_path, "my table%.csv", 100)
+    assert "my%20table%25.csv" in uri
+    with host_cache(uri, tmp_path / "cache") as path:
+        assert path.name == "my table%.csv"
+        assert path.read_bytes() == (tmp_path / "remote" / "my table%.csv").read_bytes()
+
+
+def test_host_cache_concurrent(tmp_path, downloads):
+    uri = _file(tmp_path, "weights.bin", 1024 * 1024)
+    cache = str(tmp_path / "cache")
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        contents = pool.starmap(_read, [(uri, cache)] * 4)
+
+    assert len(downloads.read_text().splitlines()) == 1
+    assert all(content == contents[0] for content in contents)
+
+
+def test_host_cache_evicts(tmp_path, downloads):
+    cache = tmp_path / "cache"
+    a, b, c = (_file(tmp_path, name, 60) for name in "abc")
+    with host_cache(a, cache, max_size=150) as path_a:
+        with host_cache(b, cache, max_size=150) as path_b:
+            pass
+        with host_cache(c, cache, max_size=150) as path_c:
+            pass
+        # `a` is the least recently used entry but is in use
+        assert path_a.exists()
+        assert not path_b.exists()
+        assert path_c.exists()
+
+
+def test_runs_local(temporary_project, tmp_path, monkeypatch):
+    cache = tmp_path / "cache"
+    monkeypatch.setenv("METAFLOW_HOST_CACHE_PATH", str(cache))
+    path = flow_name(temporary_project, "host_cache_flow")
+    with ch_dir(temporary_project / "myproject"):
+        run_flow(path)
+
+    (entry,) = (entry for entry in cache.iterdir() if entry.is_dir())
+    assert [f.name for f in entry.iterdir()] == ["host_cache_flow.py"]
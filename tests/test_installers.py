@@ -0,0 +1,204 @@
+"""Tests `@pip` installer backends."""
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from metaflow_extensions.nesta.installers import (
+    InconsistentRequirementsError,
+    install_wheels,
+    metadata,
+    parse_requirement_args,
+    UnsupportedRequirementsError,
+    Wheel,
+    wheel_layout,
+    WheelInstaller,
+)
+from metaflow_extensions.nesta.utils import ch_dir, pip
+from utils import make_wheel, remove_pkg, run_flow  # noqa: I
+
+
+@pytest.fixture
+def paths(tmp_path):
+    """Install scheme in a temporary directory."""
+    site = tmp_path / "site-packages"
+    return {
+        "purelib": str(site),
+        "platlib": str(site),
+        "scripts": str(tmp_path / "bin"),
+        "include": str(tmp_path / "include"),
+        "data": str(tmp_path),
+    }
+
+
+@pytest.fixture
+def wheels(tmp_path):
+    """Directory of wheels."""
+    wheels = tmp_path / "wheels"
+    wheels.mkdir()
+    make_wheel(wheels, "alpha", "1.0", requires=["beta>=1.0"])
+    make_wheel(wheels, "beta", "1.0")
+    make_wheel(wheels, "beta", "2.0")
+    make_wheel(wheels, "gamma", "1.0", requires=['delta; extra == "all"'])
+    return wheels
+
+
+def test_parse_requirement_args(tmp_path):
+    (tmp_path / "base.txt").write_text("beta>=1.0  # comment\n")
+    (tmp_path / "requirements.txt").write_text("# Header\n-r base.txt\nalpha\n")
+    reqs = parse_requirement_args(["-r", str(tmp_path / "requirements.txt"), "gamma"])
+    assert [str(req) for req in reqs] == ["beta>=1.0", "alpha", "gamma"]
+
+    with pytest.raises(UnsupportedRequirementsError):
+        list(parse_requirement_args(["-e", "."]))
+
+
+def test_wheel_installer(wheels, paths):
+    installer = WheelInstaller([wheels], paths=paths)
+    installer.install(["alpha", "beta<2"])
+    installer.check()
+
+    site = wheels.parent / "site-packages"
+    assert (site / "alpha" / "__init__.py").exists()
+    assert (site / "beta" / "v1_0.py").exists()
+    assert (site / "alpha-1.0.dist-info" / "INSTALLER").exists()
+    assert "alpha/__init__.py,," in (site / "alpha-1.0.dist-info/RECORD").read_text()
+    assert set(installer.installed()) == {"alpha", "beta"}
+
+    # Upgrades remove files of the previous version
+    installer.install(["beta==2.0"])
+    assert not (site / "beta" / "v1_0.py").exists()
+    assert (site / "beta" / "v2_0.py").exists()
+    assert str(installer.installed()["beta"].version) == "2.0"
+
+
+def test_install_wheels(wheels, paths):
+    class Executor(ThreadPoolExecutor):
+        def map(self, fn, *iterables):  # noqa: D102
+            self.tasks = len(iterables[0])
+            return super().map(fn, *iterables)
+
+    scheme = {key: Path(path) for key, path in paths.items()}
+    layouts = [
+        wheel_layout(Wheel(path), scheme) for path in sorted(wheels.glob("*.whl"))
+    ]
+    with Executor() as executor:
+        install_wheels(layouts, executor)
+
+    # Files of every wheel are unpacked concurrently
+    assert executor.tasks == len(layouts)
+    site = wheels.parent / "site-packages"
+    assert (site / "alpha" / "__init__.py").exists()
+    assert (site / "gamma-1.0.dist-info" / "RECORD").exists()
+
+
+def test_wheel_installer_resolve(wheels, paths):
+    installer = WheelInstaller([wheels], paths=paths)
+
+    assert [(w.name, str(w.version)) for w in installer.resolve(_reqs("alpha"))] == [
+        ("alpha", "1.0"),
+        ("beta", "2.0"),
+    ]
+    assert len(installer.resolve(_reqs("gamma"))) == 1
+    assert installer.resolve(_reqs('alpha; python_version < "3.0"')) == []
+
+    with pytest.raises(UnsupportedRequirementsError):
+        installer.resolve(_reqs("gamma[all]"))  # No `delta` wheel
+    with pytest.raises(UnsupportedRequirementsError):
+        installer.resolve(_reqs("beta==2.0", "alpha", "beta<2"))
+
+
+def test_wheel_installer_upgrade_dependencies(tmp_path, paths):
+    (tmp_path / "v1").mkdir()
+    (tmp_path / "v2").mkdir()
+    make_wheel(tmp_path / "v1", "alpha", "1.0")
+    make_wheel(tmp_path / "v2", "alpha", "2.0", requires=["beta"])
+    make_wheel(tmp_path / "v2", "beta", "1.0")
+    make_wheel(tmp_path / "v2", "other", "1.0", requires=["alpha>=2"])
+    WheelInstaller([tmp_path / "v1"], paths=paths).install(["alpha"])
+    installer = WheelInstaller([tmp_path / "v2"], paths=paths)
+
+    # `alpha` is first satisfied as installed, then upgraded by `other`
+    installer.install(["alpha", "other"])
+    installer.check()
+    assert set(installer.installed()) == {"alpha", "beta", "other"}
+
+
+def test_wheel_installer_invalid_wheel(tmp_path):
+    (tmp_path / "not-a-wheel.whl").touch()
+    with pytest.raises(UnsupportedRequirementsError):
+        WheelInstaller([tmp_path])
+
+
+def test_wheel_installer_console_scripts(tmp_path, paths):
+    make_wheel(
+        tmp_path, "tool", "1.0", entry_points="[console_scripts]\nTool = tool:main\n"
+    )
+    WheelInstaller([tmp_path], paths=paths).install(["tool"])
+
+    script = tmp_path / "bin" / "Tool"
+    assert "from tool import main" in script.read_text()
+    assert script.stat().st_mode & 0o111
+
+
+def test_wheel_installer_unsafe_path(tmp_path, paths):
+    (tmp_path / "v1").mkdir()
+    (tmp_path / "v2").mkdir()
+    make_wheel(tmp_path / "v1", "alpha", "1.0")
+    unsafe = make_wheel(tmp_path / "v2", "alpha", "2.0")
+    with zipfile.ZipFile(unsafe, "a") as zf:
+        zf.writestr("../escape.py", "")
+    WheelInstaller([tmp_path / "v1"], paths=paths).install(["alpha"])
+    installer = WheelInstaller([tmp_path / "v2"], paths=paths)
+
+    # Detected before the installed version is uninstalled
+    with pytest.raises(UnsupportedRequirementsError):
+        installer.install(["alpha==2.0"])
+    assert str(installer.installed()["alpha"].version) == "1.0"
+    assert not (tmp_path / "escape.py").exists()
+
+
+def test_wheel_installer_check(tmp_path, paths):
+    make_wheel(tmp_path, "alpha", "1.0", requires=["beta>=1.0"])
+    make_wheel(tmp_path, "beta", "0.1")
+    make_wheel(tmp_path, "beta", "1.0")
+    installer = WheelInstaller([tmp_path], paths=paths)
+
+    # Greedy resolution, no backtracking
+    with pytest.raises(UnsupportedRequirementsError):
+        installer.install(["beta<1", "alpha"])
+    assert not installer.installed()  # Fails before installing anything
+
+    installer.install(["alpha"])
+    installer.check()
+
+    installer.install(["beta==0.1"])
+    with pytest.raises(InconsistentRequirementsError):
+        installer.check()
+
+
+def _reqs(*args):
+    return list(parse_requirement_args(args))
+
+
+def test_runs_local(temporary_project):
+    flows = temporary_project / "myproject" / "myproject" / "flows"
+    remove_pkg("tqdm")  # Possibly installed at the required version by other tests
+    pip(
+        sys.executable,
+        "download",
+        "--quiet",
+        "--no-deps",
+        "--dest",
+        str(flows / "wheels"),
+        "tqdm==4.61.0",
+    )
+    with ch_dir(temporary_project / "myproject"):
+        run_flow(flows / "pip_wheel_installer_flow.py")
+
+    # Installed in-process rather than by pip
+    assert metadata.distribution("tqdm").read_text("INSTALLER").strip() == (
+        "metaflow_extensions"
+    )
@@ -0,0 +1,31 @@
+"""Tests `MmapArtifact`."""
+import json
+
+import pytest
+from metaflow import MmapArtifact
+from metaflow.exception import MetaflowException
+
+from metaflow_extensions.nesta.utils import ch_dir
+from utils import run_flow, run_flow_cli  # noqa: I
+
+flow_name = "{}/myproject/myproject/flows/{}.py".format
+
+
+def test_runs_local(temporary_project):
+    path = flow_name(temporary_project, "mmap_artifact_flow")
+    with ch_dir(temporary_project / "myproject"):
+        run_flow(path)
+        out = run_flow_cli(path, "artifacts", "report", "--json")
+
+    rows = [json.loads(line) for line in out.stdout.decode().splitlines()]
+    blob_rows = [row for row in rows if row["name"] == "blob"]
+    assert {row["step_name"] for row in blob_rows} == {"start", "fan", "join", "end"}
+    # The buffers are counted in the size of the artifact
+    assert all(row["size"] > 1024 * 1024 for row in blob_rows)
+    # Passing it through doesn't write anything new
+    assert all(row["copy_of"] for row in blob_rows if row["step_name"] != "start")
+
+
+def test_requires_task():
+    with pytest.raises(MetaflowException):
+        MmapArtifact(b"").__reduce__()
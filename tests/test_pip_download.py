@@ -0,0 +1,87 @@
+"""Tests parallel download of `@pip` requirements."""
+import hashlib
+import json
+
+import pytest
+
+from metaflow_extensions.nesta import pip_download
+from metaflow_extensions.nesta.pip_download import Download, download, fetch
+from metaflow_extensions.nesta.utils import ch_dir
+from utils import make_wheel, remove_pkg, run_flow  # noqa: I
+
+flow_name = "{}/myproject/myproject/flows/{}.py".format
+
+
+@pytest.fixture
+def wheels(tmp_path):
+    """Directory of wheels."""
+    wheels = tmp_path / "wheels"
+    wheels.mkdir()
+    make_wheel(wheels, "alpha", "1.0", requires=["beta>=1.0"])
+    make_wheel(wheels, "beta", "1.0")
+    make_wheel(wheels, "beta", "2.0")
+    return wheels
+
+
+def test_fetch(tmp_path, wheels):
+    downloads = tmp_path / "downloads"
+    downloads.mkdir()
+    events = []
+    summary = fetch(
+        "python",
+        ["--no-index", "--find-links", str(wheels), "alpha"],
+        downloads,
+        report=events.append,
+    )
+
+    assert sorted(f.name for f in downloads.iterdir()) == [
+        "alpha-1.0-py3-none-any.whl",
+        "beta-2.0-py3-none-any.whl",
+    ]
+    assert [event["event"] for event in events] == [
+        "resolved",
+        "downloaded",
+        "downloaded",
+    ]
+    assert sorted(events[0]["packages"]) == ["alpha==1.0", "beta==2.0"]
+    assert summary["bytes"] == sum(f.stat().st_size for f in downloads.iterdir())
+    assert {package["name"] for package in summary["packages"]} == {"alpha", "beta"}
+
+
+def test_download(tmp_path, wheels, monkeypatch):
+    monkeypatch.setattr(pip_download, "PROGRESS_INTERVAL", -1)
+    wheel = wheels / "beta-1.0-py3-none-any.whl"
+    sha256 = hashlib.sha256(wheel.read_bytes()).hexdigest()
+    events = []
+
+    package = download(
+        Download("beta", "1.0", wheel.as_uri(), sha256), tmp_path, events.append
+    )
+    assert (tmp_path / wheel.name).read_bytes() == wheel.read_bytes()
+    assert package["bytes"] == wheel.stat().st_size
+    assert [event["event"] for event in events] == ["progress", "downloaded"]
+
+    mismatched = tmp_path / "mismatched"
+    mismatched.mkdir()
+    with pytest.raises(ValueError, match="Hash mismatch"):
+        download(Download("beta", "1.0", wheel.as_uri(), "0" * 64), mismatched)
+    assert not list(mismatched.iterdir())
+
+
+def test_runs_local(temporary_project):
+    from metaflow import Flow, namespace
+
+    remove_pkg("tqdm")  # Possibly installed at the required version by other tests
+    path = flow_name(temporary_project, "pip_download_flow")
+    with ch_dir(temporary_project / "myproject"):
+        out = run_flow(path)
+        namespace(None)
+        task = Flow("MetaflowExtensionsPipDownloadFlow").latest_run["pip"].task
+        summary = json.loads(task.metadata_dict["pip-install"])
+
+    assert '@pip {"event": "downloaded", "name": "tqdm"' in out.stdout.decode()
+    (package,) = summary["packages"]
+    assert package["name"] == "tqdm"
+    assert package["version"] == "4.61.0"
+    assert package["bytes"] > 0
+    assert summary["install_seconds"] > 0
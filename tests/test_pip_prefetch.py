@@ -0,0 +1,72 @@
+"""Tests prefetching of `@pip` requirements."""
+import fcntl
+import json
+import os
+import time
+
+from metaflow_extensions.nesta.pip_prefetch import cleanup, requirements_key
+from metaflow_extensions.nesta.utils import ch_dir
+from utils import env, run_flow  # noqa: I
+
+flow_name = "{}/myproject/myproject/flows/{}.py".format
+
+DAY = 24 * 60 * 60
+
+
+def test_requirements_key(tmp_path):
+    reqs = tmp_path / "requirements.txt"
+    reqs.write_text("tqdm==4.61.0\n")
+    key = requirements_key(("-r", str(reqs)))
+
+    assert key == requirements_key(("-r", str(reqs)))
+    assert key != requirements_key(("tqdm==4.61.0",))
+
+    reqs.write_text("tqdm==4.62.0\n")
+    assert key != requirements_key(("-r", str(reqs)))
+
+    # Included requirements files
+    (tmp_path / "base.txt").write_text("requests\n")
+    reqs.write_text("-r base.txt\ntqdm==4.62.0\n")
+    key = requirements_key(("-r", str(reqs)))
+    (tmp_path / "base.txt").write_text("requests<2\n")
+    assert key != requirements_key(("-r", str(reqs)))
+
+
+def test_cleanup(tmp_path):
+    old, recent, partial = tmp_path / "old", tmp_path / "recent", tmp_path / "p.partial"
+    for path in (old, recent, partial):
+        path.mkdir()
+    (tmp_path / "old.lock").touch()
+    now = time.time()
+    os.utime(old, (now - 2 * DAY, now - 2 * DAY))
+    os.utime(partial, (now - 2 * DAY, now - 2 * DAY))
+
+    assert cleanup(tmp_path, DAY, now=now) == [old, partial]
+    remaining = sorted(path.name for path in tmp_path.iterdir())
+    assert remaining == ["old.lock", "p.lock", "recent"]
+
+
+def test_runs_local(temporary_project, tmp_path):
+    from metaflow import Flow, namespace
+
+    with ch_dir(temporary_project / "myproject"):
+        with env(
+            METAFLOW_PIP_PREFETCH="true", METAFLOW_PIP_PREFETCH_PATH=str(tmp_path)
+        ):
+            out = run_flow(flow_name(temporary_project, "pip_prefetch_flow"))
+        namespace(None)
+        task = Flow("MetaflowExtensionsPipPrefetchFlow").latest_run["pip"].task
+        summary = json.loads(task.metadata_dict["pip-install"])
+
+    # Prefetching is detached from the flow so may still be running, wait for
+    # it to release its locks
+    for lock in tmp_path.glob("*.lock"):
+        with open(lock) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    (wheelhouse,) = (path for path in tmp_path.iterdir() if path.is_dir())
+    assert list(wheelhouse.glob("tqdm-4.61.0-*.whl"))
+    # The step installed from the prefetched wheels
+    assert summary["prefetched_wheelhouse"] == str(wheelhouse)
+    assert '@pip {"event": "prefetched"' in out.stdout.decode()
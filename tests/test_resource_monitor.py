@@ -0,0 +1,108 @@
+"""Tests `@resource_monitor` and the `resources advise` CLI command."""
+import json
+import os
+import sys
+
+import pytest
+
+from metaflow_extensions.nesta.plugins.resource_advisor_cli import advise_step
+from metaflow_extensions.nesta.plugins.resource_monitor_decorator import (
+    ResourceMonitorDecorator,
+)
+from metaflow_extensions.nesta.resource_usage import (
+    decode,
+    downsample,
+    encode,
+    Sample,
+    sample_process_tree,
+    summarize,
+)
+from metaflow_extensions.nesta.utils import ch_dir
+from utils import run_flow, run_flow_cli  # noqa: I
+
+flow_name = "{}/myproject/myproject/flows/{}.py".format
+
+MB = 1024 * 1024
+
+linux_only = pytest.mark.skipif(
+    sys.platform != "linux", reason="Resource usage is sampled from /proc"
+)
+
+
+def _samples(n):
+    return [
+        Sample(
+            t=1_700_000_000 + i,
+            cpu=0.5 * i,
+            rss=(100 + i) * MB,
+            peak=(100 + i) * MB,
+            read=i * MB,
+            write=0,
+            rx=2 * i * MB,
+            tx=0,
+        )
+        for i in range(n)
+    ]
+
+
+def test_encode_decode():
+    samples = _samples(3600)
+    encoded = encode(samples)
+    assert len(encoded) < 16 * 1024
+    assert decode(encoded) == samples
+
+
+def test_downsample():
+    samples = _samples(100)
+    downsampled = downsample(samples, 10)
+    assert len(downsampled) <= 10
+    assert downsampled[0] == samples[0]
+    assert downsampled[-1] == samples[-1]
+    assert summarize(downsampled)["rss_peak"] == summarize(samples)["rss_peak"]
+
+
+def test_summarize():
+    summary = summarize(_samples(11))
+    assert summary["duration"] == 10
+    assert summary["cpu_mean"] == summary["cpu_p95"] == 0.5
+    assert summary["rss_peak"] == 110 * MB
+    assert summary["read"] == 10 * MB
+    assert summary["rx"] == 20 * MB
+
+
+@linux_only
+def test_sample_process_tree():
+    sample = sample_process_tree(os.getpid())
+    assert sample.cpu > 0
+    assert sample.rss > MB
+
+
+def test_advise_step():
+    summaries = [summarize(_samples(11)), {**summarize(_samples(11)), "cpu_p95": 3}]
+    advice = advise_step("fan", summaries, 1.2, (8, 16000))
+    assert advice.tasks == 2
+    assert advice.cpu == 4
+    assert advice.memory == 256  # 110MB * 1.2, rounded up
+    assert advice.current_memory == 16000
+
+
+@linux_only
+def test_runs_local(temporary_project):
+    path = flow_name(temporary_project, "resource_monitor_flow")
+    with ch_dir(temporary_project / "myproject"):
+        run_flow(path)
+        out = run_flow_cli(path, "resources", "advise", "--json")
+
+    (advice,) = [json.loads(line) for line in out.stdout.decode().splitlines()]
+    assert advice["step_name"] == "fan"
+    assert advice["tasks"] == 2
+    assert advice["rss_peak"] > 128 * MB
+    assert advice["cpu_p95"] > 0.2  # Tasks share the CPUs of the machine
+    assert advice["current_cpu"] == 8
+    assert advice["cpu"] < 8
+    assert advice["memory"] < 16000
+
+
+def test_task_finished_without_pre_step():
+    decorator = ResourceMonitorDecorator()
+    decorator.task_finished("fan", None, None, False, 0, 0)  # No AttributeError
@@ -1,10 +1,18 @@
 """Test utility functions."""
+import importlib.util
 import sys
 from unittest import mock
 
 import pytest
 
-from metaflow_extensions.nesta.utils import is_mflow_conda_environment, pip_install
+from metaflow_extensions.nesta.installers import metadata
+from metaflow_extensions.nesta.utils import (
+    compile_bytecode,
+    is_mflow_conda_environment,
+    pip_install,
+    site_packages,
+    top_level_paths,
+)
 
 
 @pytest.mark.parametrize(
@@ -61,3 +69,38 @@ def test_pip_install(paths, args, out_paths, out_args):
         # "--quiet",
         *out_args,
     )
+
+
+def test_site_packages():
+    paths = site_packages(sys.executable)
+    assert paths
+    assert any(path in sys.path for path in paths)
+
+
+def test_top_level_paths(tmp_path):
+    dist_info = tmp_path / "pkg-1.0.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text("Name: pkg\nVersion: 1.0\n")
+    (dist_info / "RECORD").write_text(
+        "pkg/__init__.py,,\n"
+        "pkg/sub/mod.py,,\n"
+        "pkg/data.json,,\n"
+        "single.py,,\n"
+        "pkg-1.0.dist-info/METADATA,,\n"
+        "../../bin/pkg,,\n"
+    )
+    (dist,) = metadata.distributions(path=[str(tmp_path)])
+
+    assert top_level_paths([dist]) == [
+        str(tmp_path / "pkg"),
+        str(tmp_path / "single.py"),
+    ]
+
+
+def test_compile_bytecode(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "__init__.py").write_text("x = 1\n")
+    (tmp_path / "pkg" / "broken.py").write_text("print 'python 2'\n")
+
+    assert compile_bytecode(sys.executable, str(tmp_path)).returncode != 0
+    assert (tmp_path / "pkg" / importlib.util.cache_from_source("__init__.py")).exists()
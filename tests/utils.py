@@ -3,6 +3,7 @@ import logging
 import os
 import subprocess
 import sys
+import zipfile
 from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Optional
@@ -57,6 +58,31 @@ def run_flow(
     if batch:
         cmd.extend(["--with", "batch"])
 
+    return _run(cmd)
+
+
+def run_flow_cli(
+    path: os.PathLike,
+    *args: str,
+    datastore: str = "local",
+    metadata: str = "local",
+    python: str = sys.executable,
+) -> subprocess.CompletedProcess:
+    """Run the Metaflow CLI command `args` for the flow at `path`."""
+    cmd = [
+        python,
+        str(Path(path)),
+        "--datastore",
+        str(datastore),
+        "--metadata",
+        str(metadata),
+        "--no-pylint",
+        *args,
+    ]
+    return _run(cmd)
+
+
+def _run(cmd: List[str]) -> subprocess.CompletedProcess:
     print(cmd)
 
     try:
@@ -79,3 +105,20 @@ def env(**kwargs) -> None:
     finally:
         os.environ.clear()
         os.environ.update(original)
+
+
+def make_wheel(directory, name, version, requires=(), entry_points=None):
+    """Write a minimal pure-Python wheel of module `name` to `directory`."""
+    dist_info = f"{name}-{version}.dist-info"
+    path = directory / f"{name}-{version}-py3-none-any.whl"
+    metadata = f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+    metadata += "".join(f"Requires-Dist: {req}\n" for req in requires)
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr(f"{name}/__init__.py", f"VERSION = {version!r}\n")
+        zf.writestr(f"{name}/v{version.replace('.', '_')}.py", "")
+        zf.writestr(f"{dist_info}/METADATA", metadata)
+        zf.writestr(f"{dist_info}/WHEEL", "Wheel-Version: 1.0\nRoot-Is-Purelib: true\n")
+        if entry_points:
+            zf.writestr(f"{dist_info}/entry_points.txt", entry_points)
+        zf.writestr(f"{dist_info}/RECORD", "")
+    return path